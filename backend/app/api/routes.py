@@ -1,18 +1,80 @@
+import csv
+import hmac
 import json
+import logging
+import math
+import threading
 import uuid
-from typing import Iterator
-from fastapi import APIRouter, Query
+from dataclasses import asdict
+from typing import Iterator, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 
 from app.core.agent import AIAgent
-from app.core.models import ContentChunk, ToolExecution
+from app.core.bulk import BULK_ERROR_MARKER, aconvert_csv, create_converter, read_first_record
+from app.core.clients import ANONYMOUS_CLIENT, MAX_CLIENT_ID_LENGTH, UnknownClientError, client_registry
+from app.core.config import ADMIN_API_KEY, REQUEST_DEADLINE, REQUEST_DEADLINE_MAX, SESSION_MAX_ACTIVE
+from app.core.deadline import Deadline
+from app.core.metrics import metrics
+from app.core.models import AgentStats, ContentChunk, DeadlineReached, StreamReset, ToolExecution
+from app.core.rates import CurrencyAPIError
+from app.core.sessions import EventBuffer, session_store
+from app.core.tracing import Span, Trace, tracer
+from app.core.usage import usage_tracker
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 agent = AIAgent()
+# Held by each running session producer, bounding the threads /convert can start
+session_slots = threading.BoundedSemaphore(SESSION_MAX_ACTIVE)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator may still be reading the request body.
+
+    StreamingResponse normally consumes receive() to watch for disconnects,
+    which would steal the request body messages. Here a disconnect surfaces
+    as ClientDisconnect from request.stream() instead.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
 
 
-def generate_response(user_message: str) -> Iterator[str]:
-    """Generate streaming response for user message."""
+def generate_response(
+    user_message: str,
+    trace: Optional[Trace] = None,
+    parent_span: Optional[Span] = None,
+    deadline: Optional[Deadline] = None,
+    session_id: Optional[str] = None,
+    client_id: str = ANONYMOUS_CLIENT,
+    conversation_id: Optional[str] = None
+) -> Iterator[str]:
+    """Generate streaming response for user message.
+
+    When a session_id is given, the request's token usage is added to that
+    session's totals. Model calls are scheduled and charged for client_id,
+    and a conversation_id continues that conversation of the client.
+    """
+    trace = trace or Trace(trace_id="", sampled=False)
+    with trace.span("generate_response", parent=parent_span) as span:
+        yield from _generate_events(
+            user_message, trace, span, deadline or Deadline(), session_id, client_id, conversation_id
+        )
+
+
+def _generate_events(
+    user_message: str,
+    trace: Trace,
+    span: Span,
+    deadline: Deadline,
+    session_id: Optional[str],
+    client_id: str,
+    conversation_id: Optional[str]
+) -> Iterator[str]:
+    """Translate agent output into SSE events."""
     step_counter = 1
     
     # Send initial step indicating we're analyzing the query
@@ -26,7 +88,14 @@ def generate_response(user_message: str) -> Iterator[str]:
     yield f'data: {json.dumps(analysis_step)}\n\n'
     step_counter += 1
     
-    for item in agent.ask(user_message):
+    for item in agent.ask(
+        user_message,
+        trace=trace,
+        parent_span=span,
+        deadline=deadline,
+        client_id=client_id,
+        conversation_id=conversation_id,
+    ):
         if isinstance(item, ContentChunk):
             data = {
                 "type": "content", 
@@ -34,6 +103,32 @@ def generate_response(user_message: str) -> Iterator[str]:
                 "step_id": step_counter
             }
             yield f'data: {json.dumps(data)}\n\n'
+        elif isinstance(item, StreamReset):
+            # Model stream failed midway; client discards this step's partial content
+            data = {
+                "type": "reset",
+                "step_id": step_counter,
+                "attempt": item.attempt,
+                "reason": item.reason
+            }
+            yield f'data: {json.dumps(data)}\n\n'
+        elif isinstance(item, DeadlineReached):
+            data = {
+                "type": "deadline_exceeded",
+                "step_id": step_counter,
+                "message": item.reason,
+                "partial_answer": item.partial_answer
+            }
+            yield f'data: {json.dumps(data)}\n\n'
+        elif isinstance(item, AgentStats):
+            if session_id:
+                usage_tracker.record(session_id, item.usage, item.prompt)
+            data = {
+                "type": "stats",
+                "step_id": step_counter,
+                **asdict(item)
+            }
+            yield f'data: {json.dumps(data)}\n\n'
         elif isinstance(item, ToolExecution):
             # Send tool selection step
             tool_selection_step = {
@@ -60,16 +155,14 @@ def generate_response(user_message: str) -> Iterator[str]:
             yield f'data: {json.dumps(tool_execution_step)}\n\n'
             step_counter += 1
             
-            # Send tool execution results
-            args_str = ", ".join(f"{k}={v}" for k, v in item.args.items())
-            tool_info = f"Tool: {item.name}({args_str}) -> {item.result}"
+            # Send tool execution results: the compact result the model saw and its rendering
             data = {
                 "type": "tool_execution",
                 "step_id": step_counter,
                 "tool_name": item.name,
                 "args": item.args,
                 "result": item.result,
-                "formatted_result": tool_info,
+                "formatted_result": item.formatted_result,
                 "status": "completed"
             }
             yield f'data: {json.dumps(data)}\n\n'
@@ -86,48 +179,156 @@ def generate_response(user_message: str) -> Iterator[str]:
     yield f'data: {json.dumps(completion_step)}\n\n'
 
 
+def session_events(
+    session_id: str,
+    query: str,
+    deadline: Deadline,
+    client_id: str = ANONYMOUS_CLIENT,
+    conversation_id: Optional[str] = None
+) -> Iterator[str]:
+    """Generate the full SSE event sequence of a session, wrapped in start/end events."""
+    trace = tracer.start_trace(session_id)
+    try:
+        with trace.span("routes.convert", query=query, client_id=client_id) as span:
+            # Send session start with ID
+            start_data = {
+                "type": "start",
+                "session_id": session_id,
+                "query": query,
+                "timestamp": json.dumps({"start": True})  # Will be replaced by actual timestamp in frontend
+            }
+            yield f'data: {json.dumps(start_data)}\n\n'
+
+            try:
+                yield from generate_response(query, trace, span, deadline, session_id, client_id, conversation_id)
+            except Exception as e:
+                span.status = "error"
+                error_data = {
+                    "type": "error",
+                    "session_id": session_id,
+                    "message": str(e),
+                    "step_id": 999,  # Error step
+                    "step_name": "error",
+                    "status": "error"
+                }
+                yield f'data: {json.dumps(error_data)}\n\n'
+
+            # Send session end
+            session_usage = usage_tracker.get_session(session_id)
+            end_data = {
+                "type": "end",
+                "session_id": session_id,
+                "usage": asdict(session_usage) if session_usage else None,
+                "timestamp": json.dumps({"end": True})  # Will be replaced by actual timestamp in frontend
+            }
+            yield f'data: {json.dumps(end_data)}\n\n'
+    finally:
+        tracer.finish_trace(trace)
+
+
+def run_session(
+    buffer: EventBuffer,
+    query: str,
+    deadline: Deadline,
+    client_id: str = ANONYMOUS_CLIENT,
+    conversation_id: Optional[str] = None
+) -> None:
+    """Produce a session's events into its buffer, independent of any client connection.
+
+    Releases the session slot taken for it by the caller once done.
+    """
+    try:
+        for event in session_events(buffer.session_id, query, deadline, client_id, conversation_id):
+            buffer.append(event)
+    except Exception:
+        logger.exception("Session %s failed", buffer.session_id)
+    finally:
+        buffer.close()
+        session_slots.release()
+
+
+def admit_client(api_key: Optional[str], client_id: Optional[str]) -> str:
+    """Identify the client of a request and count it against its quotas.
+
+    Raises HTTPException 401 for an unknown API key and 429, with a
+    Retry-After header, when the client is over its request or token quota.
+    """
+    try:
+        client_id = client_registry.identify(api_key, client_id)
+    except UnknownClientError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    retry_after = client_registry.admit(client_id)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Quota exceeded for client {client_id}",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    return client_id
+
+
 @router.get("/convert")
 async def convert(
-    query: str = Query(..., description="The conversion query, e.g., 'convert 10 km to miles'")
+    query: str = Query(..., description="The conversion query, e.g., 'convert 10 km to miles'"),
+    deadline: float = Query(
+        REQUEST_DEADLINE,
+        gt=0,
+        le=REQUEST_DEADLINE_MAX,
+        description="Time budget for the whole request in seconds"
+    ),
+    session_id: Optional[str] = Query(None, description="Session to resume after a dropped connection"),
+    conversation_id: Optional[str] = Query(
+        None,
+        max_length=MAX_CLIENT_ID_LENGTH,
+        description="Conversation whose earlier turns give context to this query"
+    ),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    api_key: Optional[str] = Header(None, alias="X-API-Key"),
+    client_id: Optional[str] = Header(None, alias="X-Client-ID")
 ) -> StreamingResponse:
-    """Convert units based on user query."""
-    
-    def response_generator():
-        # Generate unique session ID for this request
-        session_id = str(uuid.uuid4())
-        
-        # Send session start with ID
-        start_data = {
-            "type": "start",
-            "session_id": session_id,
-            "query": query,
-            "timestamp": json.dumps({"start": True})  # Will be replaced by actual timestamp in frontend
-        }
-        yield f'data: {json.dumps(start_data)}\n\n'
-        
+    """Convert units based on user query.
+
+    Every SSE event carries an id. The agent keeps running if the client
+    disconnects; reconnecting with the session_id and a Last-Event-ID header
+    replays the session from the next event without any new model calls.
+    New sessions count against the client's quotas; resumptions do not.
+    Queries with the same conversation_id from the same client share history.
+    A new session gets 503 while SESSION_MAX_ACTIVE sessions are running,
+    and resuming an unknown or expired session gets 404.
+    """
+    buffer = session_store.get(session_id) if session_id else None
+    if session_id and buffer is None:
+        # Starting over would run the query again and replay events the client already has
+        metrics.increment("sse_resumes_expired")
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+    if buffer is not None:
+        metrics.increment("sse_resumes")
         try:
-            yield from generate_response(query)
-        except Exception as e:
-            error_data = {
-                "type": "error",
-                "session_id": session_id,
-                "message": str(e),
-                "step_id": 999,  # Error step
-                "step_name": "error",
-                "status": "error"
-            }
-            yield f'data: {json.dumps(error_data)}\n\n'
-        
-        # Send session end
-        end_data = {
-            "type": "end",
-            "session_id": session_id,
-            "timestamp": json.dumps({"end": True})  # Will be replaced by actual timestamp in frontend
-        }
-        yield f'data: {json.dumps(end_data)}\n\n'
+            after = int(last_event_id or 0)
+        except ValueError:
+            after = 0
+    else:
+        # Checked before the quota so a refused session costs the client nothing
+        if not session_slots.acquire(blocking=False):
+            metrics.increment("sse_sessions_rejected")
+            raise HTTPException(status_code=503, detail="Too many active sessions, please retry shortly")
+        try:
+            client_id = admit_client(api_key, client_id)
+        except HTTPException:
+            session_slots.release()
+            raise
+        # Generate unique session ID for this request
+        buffer = session_store.create(str(uuid.uuid4()))
+        threading.Thread(
+            target=run_session,
+            args=(buffer, query, Deadline(deadline), client_id, conversation_id),
+            name=f"session-{buffer.session_id}",
+            daemon=True
+        ).start()
+        after = 0
 
     return StreamingResponse(
-        response_generator(), 
+        buffer.stream(after=after),
         media_type="text/event-stream", 
         headers={
             "Cache-Control": "no-cache", 
@@ -137,7 +338,119 @@ async def convert(
     )
 
 
+@router.post("/convert/csv")
+async def convert_csv_upload(
+    request: Request,
+    to: str = Query(..., description="Target currency code, name or symbol, e.g. 'EUR'"),
+    amount_column: str = Query("amount", description="Name of the column holding amounts"),
+    currency_column: str = Query("currency", description="Name of the column holding source currency codes"),
+    api_key: Optional[str] = Header(None, alias="X-API-Key"),
+    client_id: Optional[str] = Header(None, alias="X-Client-ID")
+) -> StreamingResponse:
+    """Convert the amount column of an uploaded CSV body into one currency.
+
+    The body is parsed and converted in fixed-size chunks and streamed back,
+    so memory use does not grow with file size.
+    """
+    admit_client(api_key, client_id)
+    try:
+        converter = await run_in_threadpool(create_converter, to, amount_column, currency_column)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CurrencyAPIError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    # Validate the header before the response starts, so a bad file gets a proper 400
+    try:
+        header, body = await read_first_record(request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if header is None:
+        raise HTTPException(status_code=400, detail="CSV body is empty")
+    try:
+        converter.check_header(header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def csv_generator():
+        try:
+            async for text in aconvert_csv(body, converter):
+                yield text
+        except (ValueError, csv.Error) as e:
+            # The status line is already sent, so end the output with a marker line
+            # rather than a silently truncated file
+            metrics.increment("bulk_conversions_failed")
+            logger.warning("Bulk conversion to %s failed: %s", converter.target_currency, e)
+            yield f"{BULK_ERROR_MARKER} {e}\n"
+        finally:
+            stats = converter.finish()
+            metrics.increment("bulk_rows_converted", stats.rows)
+            metrics.increment("bulk_rows_invalid", stats.invalid_rows)
+            metrics.set_gauge("bulk_last_rows_per_second", stats.rows_per_second)
+            logger.info(
+                "Bulk conversion to %s: %d rows (%d invalid) in %.2fs, %.0f rows/s",
+                stats.target_currency, stats.rows, stats.invalid_rows, stats.seconds, stats.rows_per_second
+            )
+
+    return DuplexStreamingResponse(
+        csv_generator(),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="converted_{converter.target_currency}.csv"',
+            "Access-Control-Allow-Origin": "*"
+        }
+    )
+
+
+@router.get("/usage")
+async def get_usage():
+    """Return global token usage and prompt-size breakdown."""
+    return usage_tracker.snapshot()
+
+
+def require_admin(admin_key: Optional[str] = Header(None, alias="X-Admin-Key")) -> None:
+    """Allow a request only with the configured ADMIN_API_KEY.
+
+    These endpoints expose other tenants' queries, tool arguments and usage,
+    so they answer 403 unless ADMIN_API_KEY is set and presented.
+    """
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_API_KEY to enable them")
+    if not admin_key or not hmac.compare_digest(admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Key")
+
+
+@router.get("/clients", dependencies=[Depends(require_admin)])
+async def get_clients():
+    """Return usage and throttle counters per client."""
+    return client_registry.snapshot()
+
+
+@router.get("/usage/{session_id}", dependencies=[Depends(require_admin)])
+async def get_session_usage(session_id: str):
+    """Return the token usage of one session."""
+    session_usage = usage_tracker.get_session(session_id)
+    if session_usage is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, **asdict(session_usage), "total_tokens": session_usage.total_tokens}
+
+
+@router.get("/debug/traces/{session_id}", dependencies=[Depends(require_admin)])
+async def get_trace(session_id: str):
+    """Return the span tree recorded for a session."""
+    trace = tracer.get_trace(session_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (not sampled or evicted)")
+    return {"trace_id": trace.trace_id, "spans": trace.to_tree()}
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "service": "ai-agent-backend"}
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Expose in-process service metrics."""
+    return metrics.snapshot()
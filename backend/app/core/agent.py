@@ -1,10 +1,94 @@
-from typing import Iterator
+import json
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Generator, Iterator, Optional
 from langchain.chat_models import init_chat_model
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage, ToolMessage
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, BaseMessage, ToolMessage
 
-from app.core.config import MODEL, MODEL_PROVIDER, SYSTEM_PROMPT
-from app.core.models import ContentChunk, ToolExecution
+from app.core.clients import ANONYMOUS_CLIENT, client_registry, model_scheduler
+from app.core.config import (
+    FORCE_FINAL_ANSWER_PROMPT,
+    LOOP_DETECTION_PATIENCE,
+    MODEL,
+    MODEL_PROVIDER,
+    STREAM_MAX_RETRIES,
+    STREAM_RETRY_BASE_DELAY,
+    STREAM_RETRY_DEADLINE,
+    STREAM_RETRY_MAX_DELAY,
+    SYSTEM_PROMPT,
+    TOOL_WORKERS,
+)
+from app.core.conversations import conversation_key, conversation_store
+from app.core.deadline import Deadline, DeadlineExceeded, iterate_within, use_deadline
+from app.core.metrics import metrics
+from app.core.models import AgentStats, ContentChunk, DeadlineReached, StreamReset, TokenUsage, ToolExecution
+from app.core.process_pool import tool_process_pool
+from app.core.tracing import Span, Trace, use_span
+from app.core.usage import estimate_tokens, prompt_breakdown, usage_from_response
 from app.tools.conversion_tools import available_tools
+from app.tools.rendering import render_tool_result
+
+
+# Tools started while the model is still streaming, keyed by tool call position
+PendingTools = dict[int, tuple[dict, Future]]
+
+
+def _normalize_arg(value: Any) -> Any:
+    """Normalize a tool argument so equivalent spellings compare equal."""
+    if isinstance(value, str):
+        return value.strip().lower()
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: _normalize_arg(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_arg(item) for item in value]
+    return value
+
+
+def tool_call_key(tool_call: dict) -> tuple[str, str]:
+    """Return the memoization key (tool name, canonicalized args) of a tool call."""
+    return tool_call['name'], json.dumps(_normalize_arg(tool_call['args']), sort_keys=True, default=str)
+
+
+def is_error_result(content: str) -> bool:
+    """Whether a tool result reports a failure, from the agent or as a compact {"error": ...}."""
+    if content.startswith("Error executing tool"):
+        return True
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return False
+    return isinstance(data, dict) and "error" in data
+
+
+@dataclass
+class _RunState:
+    """Per-request state threaded through one call to AIAgent.ask."""
+    trace: Trace
+    deadline: Deadline
+    parent_span: Optional[Span] = None
+    # Span of the agent iteration in progress; model streams and tools nest under it
+    iteration_span: Optional[Span] = None
+    memo: dict[tuple[str, str], Future] = field(default_factory=dict)
+    # Completed tool results, used for a best-effort answer if the deadline passes
+    tool_results: list[str] = field(default_factory=list)
+    stats: AgentStats = field(default_factory=AgentStats)
+    # Whether the current iteration started at least one tool not seen before
+    made_progress: bool = False
+    # Client the request is served for; its model calls share the fair queue and token quota
+    client_id: str = ANONYMOUS_CLIENT
+    # Conversation of this request only, so concurrent sessions never see each other's messages
+    messages: list[BaseMessage] = field(default_factory=list)
+    # Tool threads of this request only, so one tenant's slow tools never queue another's
+    tool_executor: ThreadPoolExecutor = field(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+    )
 
 
 class AIAgent:
@@ -19,73 +103,343 @@ class AIAgent:
         )
         self.model_with_tools = self.llm.bind_tools(available_tools)
         self.tool_mapping = {tool.name: tool for tool in available_tools}
-        self.history: list[BaseMessage] = [SystemMessage(content=SYSTEM_PROMPT)]
-    
-    def ask(self, user_message: str, max_iterations: int = 10) -> Iterator[ContentChunk | ToolExecution]:
-        """Process user message and return streaming response."""
-        self.history.append(HumanMessage(content=user_message))
-        n_iterations = 0
 
-        while n_iterations < max_iterations:
-            current_response = ""
-            tool_calls = []
+    def _run_tool(self, tool_call: dict, trace: Trace, parent: Optional[Span], deadline: Deadline) -> str:
+        """Execute a single tool call and return the content for its ToolMessage."""
+        selected_tool = self.tool_mapping[tool_call['name']]
+        with trace.span(f"tool.{tool_call['name']}", parent=parent, args=tool_call['args']) as span, \
+                use_span(span), use_deadline(deadline):
+            try:
+                if (selected_tool.metadata or {}).get('cpu_bound') and tool_process_pool.enabled:
+                    # CPU-bound tools run isolated so they cannot stall other streams
+                    span.set_attribute("executor", "process")
+                    tool_result = tool_process_pool.run(tool_call['name'], tool_call['args'], timeout=deadline.timeout(None))
+                else:
+                    tool_result = selected_tool.invoke(tool_call['args'])
+                return str(tool_result) if not hasattr(tool_result, 'content') else tool_result.content
+            except Exception as e:
+                span.status = "error"
+                return f"Error executing tool {tool_call['name']}: {str(e)}"
+
+    def _complete_tool_calls(self, message: AIMessageChunk, final: bool = False) -> Iterator[tuple[int, dict]]:
+        """Yield (position, tool_call) for every streamed tool call whose arguments are complete.
+
+        A tool call is considered complete once its accumulated argument string
+        parses as a JSON object and it names a known tool. A JSON object cannot
+        be extended by further chunks, so it is safe to start the tool early.
+        Streams often open a call with an empty argument string, so empty
+        arguments only count as {} once the stream has ended (final).
+        """
+        for position, chunk in enumerate(message.tool_call_chunks):
+            name = chunk.get('name')
+            if name not in self.tool_mapping:
+                continue
+            raw_args = chunk.get('args') or ''
+            if not raw_args.strip() and not final:
+                continue
+            try:
+                args = json.loads(raw_args or '{}')
+            except json.JSONDecodeError:
+                continue
+            if isinstance(args, dict):
+                yield position, {
+                    'name': name,
+                    'args': args,
+                    'id': chunk.get('id'),
+                    'type': 'tool_call',
+                }
+
+    def _start_tools(self, message: AIMessageChunk, pending: PendingTools, run: _RunState, final: bool = False) -> None:
+        """Submit every complete tool call in message that has not been started yet.
+
+        Calls repeating an earlier (tool name, args) pair within the request
+        reuse the memoized result instead of running the tool again.
+        """
+        for position, tool_call in self._complete_tool_calls(message, final):
+            if position in pending:
+                continue
+            key = tool_call_key(tool_call)
+            future = run.memo.get(key)
+            if future is None:
+                future = run.tool_executor.submit(self._run_tool, tool_call, run.trace, run.iteration_span, run.deadline)
+                run.memo[key] = future
+                run.made_progress = True
+            else:
+                run.stats.tool_calls_saved += 1
+            pending[position] = (tool_call, future)
+
+    def _stream_turn(
+        self,
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        run: _RunState,
+        received: list[str],
+        span: Span,
+    ) -> Generator[ContentChunk, None, tuple[str, PendingTools]]:
+        """Stream one model response, starting tools early.
+
+        Streamed text is also appended to received so callers can account for
+        partial output when the stream fails midway.
+        """
+        pending: PendingTools = {}
+        gathered = None
+        started = time.monotonic()
+        n_chunks = 0
+        for chunk in iterate_within(lambda: model.stream(messages), run.deadline):
+            if n_chunks == 0:
+                span.set_attribute("time_to_first_chunk_ms", round((time.monotonic() - started) * 1000, 3))
+            n_chunks += 1
+            span.set_attribute("chunks", n_chunks)
+
+            # Handle different chunk types for Gemini
+            if hasattr(chunk, 'content') and chunk.content:
+                content = chunk.content
+                received.append(content)
+                yield ContentChunk(content=content)
+
+            # Assemble tool call chunks and start each tool as soon as it is complete
+            if isinstance(chunk, AIMessageChunk):
+                gathered = chunk if gathered is None else gathered + chunk
+                if chunk.tool_call_chunks:
+                    self._start_tools(gathered, pending, run)
+
+        if gathered is not None:
+            # Calls still incomplete mid-stream are only final once the stream ends
+            self._start_tools(gathered, pending, run, final=True)
+
+        current_response = "".join(received)
+        self._record_usage(
+            run,
+            messages,
+            AIMessage(content=current_response, tool_calls=gathered.tool_calls if gathered is not None else []),
+            gathered.usage_metadata if gathered is not None else None,
+            span,
+        )
+        return current_response, pending
+
+    def _record_usage(
+        self,
+        run: _RunState,
+        messages: list[BaseMessage],
+        response: AIMessage,
+        usage_metadata: Optional[dict],
+        span: Span,
+    ) -> TokenUsage:
+        """Add the usage of one model call to the request stats and charge it to the client."""
+        breakdown = prompt_breakdown(messages)
+        usage = usage_from_response(usage_metadata, breakdown, response)
+        run.stats.usage.add(usage)
+        run.stats.prompt.add(breakdown)
+        client_registry.charge_tokens(run.client_id, usage)
+        span.set_attribute("input_tokens", usage.input_tokens)
+        span.set_attribute("output_tokens", usage.output_tokens)
+        return usage
 
+    def _stream_with_retry(
+        self,
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        run: _RunState,
+    ) -> Generator[ContentChunk | StreamReset, None, tuple[str, PendingTools]]:
+        """Stream one model response, retrying failed streams with jittered backoff.
+
+        Partial output from a failed attempt is discarded with a StreamReset so
+        the client never sees the same answer twice. Retries stop after
+        STREAM_MAX_RETRIES or once STREAM_RETRY_DEADLINE or the request
+        deadline has elapsed.
+        """
+        retry_deadline = time.monotonic() + STREAM_RETRY_DEADLINE
+        attempt = 0
+        while True:
+            received: list[str] = []
             try:
-                for chunk in self.model_with_tools.stream(self.history):
-                    # Handle different chunk types for Gemini
-                    if hasattr(chunk, 'content') and chunk.content:
-                        content = chunk.content
-                        current_response += content
-                        yield ContentChunk(content=content)
-
-                    # Handle tool calls
-                    if hasattr(chunk, 'tool_calls') and chunk.tool_calls:
-                        for tool_call in chunk.tool_calls:
-                            tool_calls.append(tool_call)
+                # Queue for a model call slot; a burst from one client cannot starve the others
+                with model_scheduler.slot(run.client_id, client_registry.weight(run.client_id), run.deadline) as waited, \
+                        run.trace.span("model.stream", parent=run.iteration_span, attempt=attempt + 1) as span:
+                    span.set_attribute("queue_wait_ms", round(waited * 1000, 1))
+                    try:
+                        return (yield from self._stream_turn(model, messages, run, received, span))
+                    except Exception:
+                        # Failed and deadline-aborted calls still cost tokens; charge an estimate
+                        self._record_usage(run, messages, AIMessage(content="".join(received)), None, span)
+                        raise
+            except DeadlineExceeded:
+                raise
             except Exception as e:
-                # If streaming fails, try non-streaming approach
-                response = self.model_with_tools.invoke(self.history)
-                current_response = response.content
-                tool_calls = getattr(response, 'tool_calls', [])
-                yield ContentChunk(content=current_response)
+                partial_response = "".join(received)
+                metrics.increment("model_stream_failures")
+                # The failed attempt's prompt was spent too, not just its partial output
+                breakdown = prompt_breakdown(messages)
+                prompt_tokens = breakdown.system_tokens + breakdown.history_tokens + breakdown.tool_result_tokens
+                metrics.increment("model_stream_wasted_tokens", prompt_tokens + estimate_tokens(partial_response))
+
+                attempt += 1
+                remaining = retry_deadline - time.monotonic()
+                if run.deadline.remaining() is not None:
+                    remaining = min(remaining, run.deadline.remaining())
+                if attempt > STREAM_MAX_RETRIES or remaining <= 0:
+                    raise
+
+                metrics.increment("model_stream_retries")
+                if partial_response:
+                    yield StreamReset(attempt=attempt, reason=str(e))
+
+                # Full jitter exponential backoff, never sleeping past the deadline
+                backoff = min(STREAM_RETRY_MAX_DELAY, STREAM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                time.sleep(min(remaining, random.uniform(0, backoff)))
+
+    def _finish(self, run: _RunState) -> AgentStats:
+        """Record the stats of a finished request in metrics and return them."""
+        stats = run.stats
+        metrics.increment("agent_requests")
+        metrics.increment("agent_iterations", stats.iterations)
+        metrics.increment("agent_tool_calls", stats.tool_calls)
+        metrics.increment("agent_tool_calls_saved", stats.tool_calls_saved)
+        if stats.loop_detected:
+            metrics.increment("agent_loops_detected")
+        return stats
+
+    def _iterate(self, run: _RunState) -> Generator[ContentChunk | StreamReset | ToolExecution, None, Optional[str]]:
+        """Run one model turn and its tool calls.
+
+        Returns the final response text when the model answered without
+        calling tools, otherwise None.
+        """
+        run.made_progress = False
+        current_response, pending = yield from self._stream_with_retry(self.model_with_tools, run.messages, run)
+        tool_calls = [tool_call for _, (tool_call, _) in sorted(pending.items())]
+        run.stats.iterations += 1
+
+        run.messages.append(AIMessage(content=current_response, tool_calls=tool_calls))
+
+        if not tool_calls:
+            # No tool calls, conversation is complete
+            return current_response
+
+        # Collect results in the order the model emitted the tool calls
+        started_tools = [started for _, started in sorted(pending.items())]
+        for index, (tool_call, future) in enumerate(started_tools):
+            try:
+                tool_msg_content = future.result(timeout=run.deadline.timeout(None))
+            except (DeadlineExceeded, FutureTimeoutError):
+                # Keep history valid: every tool call needs a matching ToolMessage
+                for unfinished_call, _ in started_tools[index:]:
+                    run.messages.append(ToolMessage(
+                        content=f"Error executing tool {unfinished_call['name']}: request deadline exceeded",
+                        tool_call_id=unfinished_call.get('id') or 'tool_call'
+                    ))
+                raise DeadlineExceeded("Request deadline exceeded while waiting for tools")
+            run.stats.tool_calls += 1
+            if is_error_result(tool_msg_content):
+                # Only successful results are reused; a repeat of a failed call runs again
+                key = tool_call_key(tool_call)
+                if run.memo.get(key) is future:
+                    del run.memo[key]
+            run.tool_results.append(f"{tool_call['name']}({tool_call['args']}) -> {tool_msg_content}")
+
+            # Create tool message for history
+            tool_msg = ToolMessage(
+                content=tool_msg_content,
+                tool_call_id=tool_call.get('id') or 'tool_call'
+            )
+            run.messages.append(tool_msg)
+
+            yield ToolExecution(
+                name=tool_call['name'],
+                args=tool_call['args'],
+                result=tool_msg_content,
+                formatted_result=render_tool_result(tool_call['name'], tool_call['args'], tool_msg_content)
+            )
+        return None
+
+    def ask(
+        self,
+        user_message: str,
+        max_iterations: int = 10,
+        trace: Optional[Trace] = None,
+        parent_span: Optional[Span] = None,
+        deadline: Optional[Deadline] = None,
+        client_id: str = ANONYMOUS_CLIENT,
+        conversation_id: Optional[str] = None,
+    ) -> Iterator[ContentChunk | StreamReset | ToolExecution | DeadlineReached | AgentStats]:
+        """Process user message and return streaming response.
+
+        The final item is an AgentStats summary of the request, yielded even
+        when the request then fails with an exception. When a trace is
+        given, each iteration, model stream and tool call is recorded as a span.
+        When the deadline passes, a DeadlineReached with a best-effort partial
+        answer is yielded instead of an error. Model calls are queued fairly
+        across clients and their tokens charged to client_id's quota.
+
+        With a conversation_id, the request continues the history of that
+        conversation of client_id, so follow-up questions have context;
+        without one it starts from the system prompt alone.
+        """
+        key = conversation_key(client_id, conversation_id)
+        history = conversation_store.get(key) if key else []
+        run = _RunState(
+            trace=trace or Trace(trace_id="", sampled=False),
+            deadline=deadline or Deadline(),
+            parent_span=parent_span,
+            client_id=client_id,
+            messages=[SystemMessage(content=SYSTEM_PROMPT), *history, HumanMessage(content=user_message)],
+        )
+        try:
+            yield from self._loop(run, max_iterations)
+            if key:
+                conversation_store.save(key, run.messages[1:])
+        except DeadlineExceeded as e:
+            metrics.increment("agent_deadline_exceeded")
+            partial_answer = self._partial_answer(run)
+            if key:
+                if not isinstance(run.messages[-1], AIMessage):
+                    run.messages.append(AIMessage(content=partial_answer))
+                conversation_store.save(key, run.messages[1:])
+            yield DeadlineReached(reason=str(e), partial_answer=partial_answer)
+            yield self._finish(run)
+        except Exception:
+            # Report the usage of a failed request too; its model calls were already charged
+            metrics.increment("agent_errors")
+            yield self._finish(run)
+            raise
+        finally:
+            # Tool calls nobody will wait for any more are dropped instead of run
+            run.tool_executor.shutdown(wait=False, cancel_futures=True)
 
-            self.history.append(AIMessage(content=current_response, tool_calls=tool_calls))
+    def _partial_answer(self, run: _RunState) -> str:
+        """Summarize what was learned before the deadline passed."""
+        if not run.tool_results:
+            return "I ran out of time before I could finish answering. Please try again."
+        results = "\n".join(f"- {result}" for result in run.tool_results)
+        return f"I ran out of time before finishing. Results gathered so far:\n{results}"
 
-            if not tool_calls:
-                # No tool calls, conversation is complete
+    def _loop(self, run: _RunState, max_iterations: int) -> Iterator[ContentChunk | StreamReset | ToolExecution | AgentStats]:
+        """Iterate model turns and tool calls until the model gives a final answer."""
+        n_iterations = 0
+        stalled_iterations = 0
+
+        while n_iterations < max_iterations:
+            with run.trace.span("agent.iteration", parent=run.parent_span, iteration=n_iterations + 1) as iteration_span:
+                run.iteration_span = iteration_span
+                result = yield from self._iterate(run)
+            if result is not None:
+                yield self._finish(run)
                 return
-            
-            for tool_call in tool_calls:
-                selected_tool = self.tool_mapping.get(tool_call['name'])
-                if selected_tool:
-                    try:
-                        tool_result = selected_tool.invoke(tool_call['args'])
-                        tool_msg_content = str(tool_result) if not hasattr(tool_result, 'content') else tool_result.content
-                        
-                        # Create tool message for history
-                        tool_msg = ToolMessage(
-                            content=tool_msg_content,
-                            tool_call_id=tool_call.get('id', 'tool_call')
-                        )
-                        self.history.append(tool_msg)
-
-                        yield ToolExecution(
-                            name=tool_call['name'],
-                            args=tool_call['args'],
-                            result=tool_msg_content
-                        )
-                    except Exception as e:
-                        error_msg = f"Error executing tool {tool_call['name']}: {str(e)}"
-                        tool_msg = ToolMessage(
-                            content=error_msg,
-                            tool_call_id=tool_call.get('id', 'tool_call')
-                        )
-                        self.history.append(tool_msg)
-                        yield ToolExecution(
-                            name=tool_call['name'],
-                            args=tool_call['args'],
-                            result=error_msg
-                        )
 
             n_iterations += 1
+
+            # An iteration that only repeats earlier tool calls learned nothing new
+            stalled_iterations = 0 if run.made_progress else stalled_iterations + 1
+            if stalled_iterations >= LOOP_DETECTION_PATIENCE and n_iterations < max_iterations:
+                run.stats.loop_detected = True
+                # Unused iteration budget when the loop was cut short, not a measured saving
+                run.stats.iterations_remaining = max_iterations - n_iterations - 1
+                messages = run.messages + [HumanMessage(content=FORCE_FINAL_ANSWER_PROMPT)]
+                with run.trace.span("agent.final_answer", parent=run.parent_span) as final_span:
+                    run.iteration_span = final_span
+                    current_response, _ = yield from self._stream_with_retry(self.llm, messages, run)
+                run.stats.iterations += 1
+                run.messages.append(AIMessage(content=current_response))
+                yield self._finish(run)
+                return
         raise ValueError("Maximum iterations reached without a final response.")
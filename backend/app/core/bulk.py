@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import io
+import sys
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+import numpy as np
+
+from app.core.config import BULK_CHUNK_SIZE, BULK_MAX_RECORD_SIZE
+from app.core.currency_catalog import catalog
+from app.core.models import BulkConversionStats
+from app.core.rates import rate_cache
+
+# Starts the last output line when a file turns out malformed after output has begun
+BULK_ERROR_MARKER = "#ERROR:"
+
+
+def _ends_quoted(line: str, quoted: bool) -> bool:
+    """Return whether a quoted field is still open at the end of line.
+
+    quoted tells whether the line starts inside a quoted field. As in the csv
+    module, only a quote at the start of a field opens quoting; a stray quote
+    inside an unquoted field, as in `12" pipe`, is an ordinary character.
+    """
+    if not quoted and '"' not in line:
+        return False
+    pos = 0
+    while True:
+        if quoted:
+            end = line.find('"', pos)
+            if end < 0:
+                return True
+            if line.startswith('"', end + 1):
+                # Escaped quote, the field goes on
+                pos = end + 2
+                continue
+            quoted = False
+            pos = end + 1
+        elif line.startswith('"', pos):
+            quoted = True
+            pos += 1
+            continue
+        delimiter = line.find(",", pos)
+        if delimiter < 0:
+            return False
+        pos = delimiter + 1
+
+
+class RecordBatcher:
+    """Split CSV text fed in arbitrary pieces into batches of complete records.
+
+    A record ends at a newline that is not inside a quoted field, so quoted
+    values containing newlines are never cut in half between batches.
+    Raises ValueError for a record longer than max_record_size characters,
+    so a malformed quote cannot make it buffer the rest of the input.
+    """
+
+    def __init__(self, batch_size: int = BULK_CHUNK_SIZE, max_record_size: int = BULK_MAX_RECORD_SIZE):
+        self.batch_size = batch_size
+        self.max_record_size = max_record_size
+        self._buffer = ""
+        self._lines: list[str] = []
+        self._pending_size = 0
+        self._quoted = False
+        self._records: list[str] = []
+
+    def feed(self, text: str) -> list[list[str]]:
+        """Add text and return the batches it completed."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        self._collect(lines)
+        self._check_size(len(self._buffer))
+        batches = []
+        while len(self._records) >= self.batch_size:
+            batches.append(self._records[:self.batch_size])
+            del self._records[:self.batch_size]
+        return batches
+
+    def close(self) -> list[list[str]]:
+        """Return the remaining records once the input is exhausted."""
+        self._collect([self._buffer] if self._buffer else [])
+        self._buffer = ""
+        if self._lines:
+            self._records.append("\n".join(self._lines))
+            self._lines = []
+        batches = [self._records] if self._records else []
+        self._records = []
+        return batches
+
+    def _collect(self, lines: list[str]) -> None:
+        for line in lines:
+            self._lines.append(line)
+            self._pending_size += len(line) + 1
+            self._quoted = _ends_quoted(line, self._quoted)
+            if not self._quoted:
+                self._records.append("\n".join(self._lines))
+                self._lines = []
+                self._pending_size = 0
+            else:
+                self._check_size(0)
+
+    def _check_size(self, partial_line: int) -> None:
+        if self._pending_size + partial_line > self.max_record_size:
+            raise ValueError(
+                f"CSV record longer than {self.max_record_size} characters; check for an unclosed quoted field"
+            )
+
+
+class CurrencyCsvConverter:
+    """Convert the amount column of CSV records into one target currency.
+
+    Every chunk is converted against the same rate snapshot, so a file is
+    internally consistent no matter how long it takes to stream.
+    """
+
+    def __init__(
+        self,
+        target_currency: str,
+        rates: dict[str, float],
+        amount_column: str = "amount",
+        currency_column: str = "currency",
+    ):
+        self.target_currency = target_currency
+        self.rates = rates
+        self.amount_column = amount_column
+        self.currency_column = currency_column
+        self.output_column = f"{amount_column}_{target_currency}"
+        self.stats = BulkConversionStats(target_currency=target_currency)
+        self._amount_index: Optional[int] = None
+        self._currency_index: Optional[int] = None
+        self._started = time.monotonic()
+
+    def convert_records(self, records: list[str]) -> str:
+        """Convert a batch of records and return them as CSV text.
+
+        The first record of the first batch is taken as the header.
+        """
+        rows = [row for row in csv.reader(records) if row]
+        output = ""
+        if self._amount_index is None and rows:
+            output = self._read_header(rows.pop(0))
+        if not rows:
+            return output
+        width = max(self._amount_index, self._currency_index) + 1
+        for row in rows:
+            if len(row) < width:
+                row.extend([""] * (width - len(row)))
+
+        amounts = self._parse_amounts([row[self._amount_index] for row in rows])
+
+        # Look rates up once per distinct currency and broadcast back to rows
+        codes = np.array([row[self._currency_index].strip().upper() for row in rows])
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        unique_rates = np.array([self.rates.get(code, np.nan) for code in unique_codes], dtype=float)
+        converted = amounts / unique_rates[inverse]
+
+        valid = np.isfinite(converted)
+        formatted = np.where(valid, np.char.mod("%.2f", np.where(valid, converted, 0.0)), "")
+        for row, value in zip(rows, formatted.tolist()):
+            row.append(value)
+
+        self.stats.rows += len(rows)
+        self.stats.invalid_rows += int(len(rows) - np.count_nonzero(valid))
+        self.stats.chunks += 1
+        self._update_throughput()
+        return output + self._write(rows)
+
+    def check_header(self, record: str) -> None:
+        """Raise ValueError unless record is a header with the amount and currency columns."""
+        self._column_indexes(next(csv.reader([record]), []))
+
+    def _read_header(self, header: list[str]) -> str:
+        self._amount_index, self._currency_index = self._column_indexes(header)
+        return self._write([header + [self.output_column]])
+
+    def _column_indexes(self, header: list[str]) -> tuple[int, int]:
+        try:
+            return header.index(self.amount_column), header.index(self.currency_column)
+        except ValueError:
+            raise ValueError(
+                f"CSV header must contain '{self.amount_column}' and '{self.currency_column}' columns"
+            )
+
+    def finish(self) -> BulkConversionStats:
+        """Finalize and return the conversion stats."""
+        self._update_throughput()
+        return self.stats
+
+    def _update_throughput(self) -> None:
+        self.stats.seconds = time.monotonic() - self._started
+        if self.stats.seconds > 0:
+            self.stats.rows_per_second = self.stats.rows / self.stats.seconds
+
+    @staticmethod
+    def _parse_amounts(values: list[str]) -> np.ndarray:
+        try:
+            return np.array(values).astype(float)
+        except ValueError:
+            # Slow path only for chunks that contain blank or malformed amounts
+            parsed = np.empty(len(values), dtype=float)
+            for i, value in enumerate(values):
+                try:
+                    parsed[i] = float(value)
+                except ValueError:
+                    parsed[i] = np.nan
+            return parsed
+
+    @staticmethod
+    def _write(rows: list[list[str]]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+
+def create_converter(target_currency: str, amount_column: str = "amount", currency_column: str = "currency") -> CurrencyCsvConverter:
+    """Create a converter backed by a snapshot of all current rates for target_currency.
+
+    Raises ValueError for a currency the catalog cannot resolve, before any API call.
+    """
+    code = catalog.resolve(target_currency)
+    if code is None:
+        raise ValueError(f"Unsupported currency: {target_currency}")
+    target_currency = code
+    return CurrencyCsvConverter(target_currency, rate_cache.get(target_currency).rates, amount_column, currency_column)
+
+
+def convert_csv(pieces: Iterable[str], converter: CurrencyCsvConverter, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[str]:
+    """Stream converted CSV text for CSV text pieces, chunk_size records at a time."""
+    batcher = RecordBatcher(chunk_size)
+    for piece in pieces:
+        for batch in batcher.feed(piece):
+            yield converter.convert_records(batch)
+    for batch in batcher.close():
+        yield converter.convert_records(batch)
+
+
+async def aconvert_csv(
+    body: AsyncIterable[bytes], converter: CurrencyCsvConverter, chunk_size: int = BULK_CHUNK_SIZE
+) -> AsyncIterator[str]:
+    """Async variant of convert_csv for a streamed request body.
+
+    Batches are converted in a worker thread to keep the event loop free.
+    """
+    batcher = RecordBatcher(chunk_size)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    async for data in body:
+        for batch in batcher.feed(decoder.decode(data)):
+            yield await asyncio.to_thread(converter.convert_records, batch)
+    for batch in batcher.feed(decoder.decode(b"", final=True)) + batcher.close():
+        yield await asyncio.to_thread(converter.convert_records, batch)
+
+
+async def read_first_record(body: AsyncIterator[bytes]) -> tuple[Optional[str], AsyncIterator[bytes]]:
+    """Read body up to its first non-blank CSV record, such as the header.
+
+    Returns the record (None for an empty body) and an iterator that replays
+    the whole body from the start, so the record can be validated before
+    any response is sent.
+    """
+    buffered: list[bytes] = []
+    batcher = RecordBatcher(1)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    record = None
+    async for data in body:
+        buffered.append(data)
+        record = _feed_until_record(batcher, decoder.decode(data))
+        if record is not None:
+            break
+    else:
+        record = _first_non_blank(batcher.feed(decoder.decode(b"", final=True)) + batcher.close())
+
+    async def replay() -> AsyncIterator[bytes]:
+        for data in buffered:
+            yield data
+        async for data in body:
+            yield data
+
+    return record, replay()
+
+
+def _feed_until_record(batcher: RecordBatcher, text: str) -> Optional[str]:
+    # Line by line, so records after the first one cannot fail the read
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        end = len(text) if end < 0 else end + 1
+        record = _first_non_blank(batcher.feed(text[start:end]))
+        if record is not None:
+            return record
+        start = end
+    return None
+
+
+def _first_non_blank(batches: list[list[str]]) -> Optional[str]:
+    return next((record for batch in batches for record in batch if record.strip()), None)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Command line entry point: convert a CSV file and report throughput."""
+    parser = argparse.ArgumentParser(description="Convert the amount column of a CSV file into one currency.")
+    parser.add_argument("input", help="Input CSV file, or - for stdin")
+    parser.add_argument("--to", required=True, help="Target currency code, e.g. EUR")
+    parser.add_argument("-o", "--output", default="-", help="Output CSV file, or - for stdout (default)")
+    parser.add_argument("--amount-column", default="amount")
+    parser.add_argument("--currency-column", default="currency")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        converter = create_converter(args.to, args.amount_column, args.currency_column)
+    except ValueError as e:
+        parser.error(str(e))
+    source = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8-sig")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        pieces = iter(lambda: source.read(1024 * 1024), "")
+        for text in convert_csv(pieces, converter, args.chunk_size):
+            target.write(text)
+    except (ValueError, csv.Error) as e:
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    stats = converter.finish()
+    print(
+        f"Converted {stats.rows:,} rows ({stats.invalid_rows:,} invalid) to {stats.target_currency} "
+        f"in {stats.seconds:.2f}s - {stats.rows_per_second:,.0f} rows/s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from app.core.config import (
+    CLIENT_API_KEYS,
+    CLIENT_MAX_CLIENTS,
+    CLIENT_REQUEST_BURST,
+    CLIENT_REQUESTS_PER_MINUTE,
+    CLIENT_TOKEN_BURST,
+    CLIENT_TOKENS_PER_MINUTE,
+    MODEL_CONCURRENCY,
+)
+from app.core.deadline import Deadline
+from app.core.metrics import metrics
+from app.core.models import TokenUsage
+
+# Client of requests that carry neither an API key nor an X-Client-ID header
+ANONYMOUS_CLIENT = "anonymous"
+
+# Longest accepted X-Client-ID value
+MAX_CLIENT_ID_LENGTH = 64
+
+
+class UnknownClientError(Exception):
+    """Raised when a request presents an unknown API key or claims a keyed client without its key."""
+
+
+def parse_api_keys(spec: str) -> dict[str, tuple[str, float]]:
+    """Parse comma-separated api_key:client_id[:weight] entries into key -> (client_id, weight)."""
+    keys = {}
+    for entry in spec.split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            continue
+        weight = float(parts[2]) if len(parts) > 2 and parts[2] else 1.0
+        keys[parts[0]] = (parts[1], max(weight, 0.01))
+    return keys
+
+
+class TokenBucket:
+    """Bucket refilled at rate tokens per second up to capacity.
+
+    Usage that is only known afterwards is charged with charge(), which may
+    leave the level negative; nothing is admitted until it refills past zero.
+    Not thread-safe on its own.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated_at = time.monotonic()
+
+    def try_take(self, amount: float = 1) -> bool:
+        """Take amount if available and return whether it was."""
+        self._refill()
+        if self.level < amount:
+            return False
+        self.level -= amount
+        return True
+
+    def charge(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def wait_time(self, amount: float = 1) -> float:
+        """Seconds until amount will be available."""
+        self._refill()
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate > 0 else float("inf")
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class _Client:
+    """Quotas and counters of one client."""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.requests = TokenBucket(CLIENT_REQUESTS_PER_MINUTE * weight / 60, CLIENT_REQUEST_BURST * weight)
+        self.tokens = TokenBucket(CLIENT_TOKENS_PER_MINUTE * weight / 60, CLIENT_TOKEN_BURST * weight)
+        self.usage = TokenUsage()
+        self.admitted = 0
+        self.throttled_requests = 0
+        self.throttled_tokens = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "weight": self.weight,
+            "requests_admitted": self.admitted,
+            "requests_throttled": self.throttled_requests,
+            "requests_throttled_by_tokens": self.throttled_tokens,
+            "requests_available": round(self.requests.level, 2),
+            "model_tokens_available": round(self.tokens.level),
+            "input_tokens": self.usage.input_tokens,
+            "output_tokens": self.usage.output_tokens,
+            "total_tokens": self.usage.total_tokens,
+            "model_calls": self.usage.model_calls,
+        }
+
+
+class ClientRegistry:
+    """Identifies clients and enforces their request and model-token quotas.
+
+    Clients are kept least recently used first and bounded in number, since
+    X-Client-ID values are not authenticated.
+    """
+
+    def __init__(self, api_keys: str = CLIENT_API_KEYS, max_clients: int = CLIENT_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._keys = parse_api_keys(api_keys)
+        self._keyed_clients = {client_id: weight for client_id, weight in self._keys.values()}
+        self._clients: OrderedDict[str, _Client] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def identify(self, api_key: Optional[str], client_id: Optional[str]) -> str:
+        """Return the client of a request from its API key, else its X-Client-ID header."""
+        if api_key:
+            if api_key not in self._keys:
+                raise UnknownClientError("Unknown API key")
+            return self._keys[api_key][0]
+        client_id = (client_id or "").strip()[:MAX_CLIENT_ID_LENGTH]
+        if client_id in self._keyed_clients:
+            raise UnknownClientError(f"Client {client_id} must authenticate with its API key")
+        return client_id or ANONYMOUS_CLIENT
+
+    def weight(self, client_id: str) -> float:
+        return self._keyed_clients.get(client_id, 1.0)
+
+    def admit(self, client_id: str) -> Optional[float]:
+        """Count a new request against the client's quotas.
+
+        Returns None if it is admitted, otherwise the seconds after which it
+        may be retried. Requests are refused while the client's model-token
+        bucket is in debt, as well as when its request bucket is empty.
+        """
+        with self._lock:
+            client = self._get(client_id)
+            token_wait = client.tokens.wait_time(1)
+            if token_wait > 0:
+                client.throttled_tokens += 1
+                retry_after = token_wait
+            elif not client.requests.try_take():
+                client.throttled_requests += 1
+                retry_after = client.requests.wait_time()
+            else:
+                client.admitted += 1
+                retry_after = None
+        metrics.increment("client_requests_admitted" if retry_after is None else "client_requests_throttled")
+        return retry_after
+
+    def charge_tokens(self, client_id: str, usage: TokenUsage) -> None:
+        """Charge the tokens of a finished model call to the client."""
+        with self._lock:
+            client = self._get(client_id)
+            client.tokens.charge(usage.total_tokens)
+            client.usage.add(usage)
+
+    def snapshot(self) -> dict:
+        """Usage and throttle counters per client."""
+        with self._lock:
+            return {client_id: client.snapshot() for client_id, client in self._clients.items()}
+
+    def _get(self, client_id: str) -> _Client:
+        client = self._clients.pop(client_id, None) or _Client(self.weight(client_id))
+        self._clients[client_id] = client
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+        return client
+
+
+class FairScheduler:
+    """Weighted fair queue in front of a fixed number of concurrent model calls.
+
+    Uses start-time fair queueing: each call is tagged with a virtual start
+    time of max(current virtual time, the client's previous finish tag), its
+    finish tag advances by 1 / weight, and free slots go to the smallest
+    start tag. A client that bursts many calls only queues behind itself, so
+    other clients keep their share of the slots.
+    """
+
+    def __init__(self, slots: int = MODEL_CONCURRENCY):
+        self.slots = slots
+        self._condition = threading.Condition()
+        self._in_use = 0
+        self._virtual_time = 0.0
+        self._finish_tags: dict[str, float] = {}
+        self._waiting: list[tuple[float, int]] = []
+        self._sequence = itertools.count()
+
+    @contextmanager
+    def slot(self, client_id: str, weight: float = 1.0, deadline: Optional[Deadline] = None) -> Iterator[float]:
+        """Hold one model call slot for the block and yield the seconds spent queued.
+
+        Raises DeadlineExceeded if the deadline passes while waiting.
+        """
+        if self.slots <= 0:
+            yield 0.0
+            return
+
+        queued_at = time.monotonic()
+        with self._condition:
+            start_tag = max(self._virtual_time, self._finish_tags.get(client_id, 0.0))
+            self._finish_tags[client_id] = start_tag + 1 / weight
+            ticket = (start_tag, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            self._update_gauges()
+            try:
+                while self._in_use >= self.slots or self._waiting[0] is not ticket:
+                    self._condition.wait(deadline.timeout(None) if deadline else None)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                self._update_gauges()
+                raise
+            heapq.heappop(self._waiting)
+            self._in_use += 1
+            self._virtual_time = start_tag
+            self._forget_idle_clients()
+            self._update_gauges()
+            # The next waiter may fit in a remaining free slot
+            self._condition.notify_all()
+
+        waited = time.monotonic() - queued_at
+        metrics.increment("model_queue_wait_seconds", waited)
+        try:
+            yield waited
+        finally:
+            with self._condition:
+                self._in_use -= 1
+                self._update_gauges()
+                self._condition.notify_all()
+
+    def _forget_idle_clients(self) -> None:
+        # A finish tag at or behind the virtual time means the same as no tag at all
+        if len(self._finish_tags) > CLIENT_MAX_CLIENTS:
+            self._finish_tags = {
+                client_id: tag for client_id, tag in self._finish_tags.items() if tag > self._virtual_time
+            }
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("model_calls_in_flight", self._in_use)
+        metrics.set_gauge("model_calls_queued", len(self._waiting))
+
+
+client_registry = ClientRegistry()
+model_scheduler = FairScheduler()
@@ -15,6 +15,88 @@ KG_TO_LBS = 2.20462
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 8000))
 
+# Request deadline configuration (seconds)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 120))
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", 600))
+
+# SSE session buffers kept for Last-Event-ID resumption
+SESSION_TTL = float(os.getenv("SESSION_TTL", 300))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 1000))
+SESSION_BUFFER_MAX_EVENTS = int(os.getenv("SESSION_BUFFER_MAX_EVENTS", 2000))
+SESSION_BUFFER_MAX_BYTES = int(os.getenv("SESSION_BUFFER_MAX_BYTES", 256 * 1024))
+SESSION_KEEPALIVE_SECONDS = float(os.getenv("SESSION_KEEPALIVE_SECONDS", 15))
+# Sessions whose agent runs at once; new sessions beyond this get 503
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", 100))
+
+# Chat history kept per (client, conversation id) for follow-up questions
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", 30 * 60))
+CONVERSATION_MAX_CONVERSATIONS = int(os.getenv("CONVERSATION_MAX_CONVERSATIONS", 1000))
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", 40))
+
+# Per-client quotas and fair sharing of model calls. CLIENT_API_KEYS holds comma-separated
+# api_key:client_id[:weight] entries; requests without a key are identified by X-Client-ID.
+# Quotas and fair-queue shares scale with the client's weight (default 1).
+CLIENT_API_KEYS = os.getenv("CLIENT_API_KEYS", "")
+CLIENT_MAX_CLIENTS = int(os.getenv("CLIENT_MAX_CLIENTS", 1000))
+CLIENT_REQUESTS_PER_MINUTE = float(os.getenv("CLIENT_REQUESTS_PER_MINUTE", 30))
+CLIENT_REQUEST_BURST = float(os.getenv("CLIENT_REQUEST_BURST", 10))
+CLIENT_TOKENS_PER_MINUTE = float(os.getenv("CLIENT_TOKENS_PER_MINUTE", 60000))
+CLIENT_TOKEN_BURST = float(os.getenv("CLIENT_TOKEN_BURST", 120000))
+# Key required in X-Admin-Key for per-client, per-session and debug endpoints; unset disables them
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+# Model calls in flight across all clients; further calls wait in the weighted-fair queue
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", 4))
+
+# Agent configuration
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", 4))
+# Process pool for CPU-bound tools; 0 workers runs them inline on the tool threads
+CPU_TOOL_WORKERS = int(os.getenv("CPU_TOOL_WORKERS", 2))
+CPU_TOOL_TIMEOUT = float(os.getenv("CPU_TOOL_TIMEOUT", 5.0))
+CPU_TOOL_CPU_SECONDS = float(os.getenv("CPU_TOOL_CPU_SECONDS", 2.0))
+CPU_TOOL_MEMORY_MB = int(os.getenv("CPU_TOOL_MEMORY_MB", 1024))
+# Consecutive iterations that only repeat earlier tool calls before forcing a final answer
+LOOP_DETECTION_PATIENCE = int(os.getenv("LOOP_DETECTION_PATIENCE", 2))
+
+# Seconds between refreshes of the locally cached currency catalog
+CURRENCY_CATALOG_TTL = float(os.getenv("CURRENCY_CATALOG_TTL", 24 * 60 * 60))
+
+# Exchange rate cache and refresh-ahead scheduler configuration
+RATE_CACHE_TTL = float(os.getenv("RATE_CACHE_TTL", 15 * 60))
+RATE_API_QUOTA_PER_HOUR = int(os.getenv("RATE_API_QUOTA_PER_HOUR", 60))
+# Share of the hourly quota the scheduler may spend; the rest is left for cache misses
+RATE_REFRESH_QUOTA_SHARE = float(os.getenv("RATE_REFRESH_QUOTA_SHARE", 0.5))
+RATE_REFRESH_LEAD = float(os.getenv("RATE_REFRESH_LEAD", 30))
+RATE_REFRESH_MAX_BASES = int(os.getenv("RATE_REFRESH_MAX_BASES", 8))
+# Half-life in seconds of the request counts used to rank hot base currencies
+RATE_HOT_HALF_LIFE = float(os.getenv("RATE_HOT_HALF_LIFE", 60 * 60))
+
+# Bulk CSV conversion configuration
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 10000))
+# Longest accepted CSV record (characters), so a runaway quoted field cannot buffer the whole file
+BULK_MAX_RECORD_SIZE = int(os.getenv("BULK_MAX_RECORD_SIZE", 1024 * 1024))
+
+# Tracing configuration
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 200))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", 10 * 1024 * 1024))
+TRACE_FILE_BACKUP_COUNT = int(os.getenv("TRACE_FILE_BACKUP_COUNT", 5))
+
+# Number of sessions whose token usage is kept in memory
+USAGE_SESSION_LIMIT = int(os.getenv("USAGE_SESSION_LIMIT", 10000))
+
+# Model stream retry configuration
+STREAM_MAX_RETRIES = int(os.getenv("STREAM_MAX_RETRIES", 2))
+STREAM_RETRY_BASE_DELAY = float(os.getenv("STREAM_RETRY_BASE_DELAY", 0.5))
+STREAM_RETRY_MAX_DELAY = float(os.getenv("STREAM_RETRY_MAX_DELAY", 4.0))
+STREAM_RETRY_DEADLINE = float(os.getenv("STREAM_RETRY_DEADLINE", 30.0))
+
+# Instruction sent (without tools) when the agent loop stops making progress
+FORCE_FINAL_ANSWER_PROMPT = (
+    "You already have the results of all the tool calls you need. "
+    "Do not call any more tools; answer the original request now using those results."
+)
+
 # System prompt for the AI agent
 SYSTEM_PROMPT = """
 You are a precise and reliable digital conversion assistant with currency conversion capabilities.
@@ -24,25 +106,27 @@ You will use the available tools to perform conversions and provide step-by-step
 
 <instructions>
 1. Analyze the user's request to identify all required unit conversions or currency conversions.
-2. For unit conversions, use the appropriate conversion tools with built-in conversion factors.
-3. For currency conversions, use the currency conversion tools with real-time exchange rates.
+2. For unit conversions, use the appropriate conversion tools with built-in conversion factors. When several values of the same quantity need converting, pass them all as a list (with one unit per value if the units differ) in a single call.
+3. For currency conversions, use the currency conversion tools with real-time exchange rates. When a request involves more than one source or target currency, make a single `convert_currency_multi` call instead of several `convert_currency` calls.
 4. Always show your calculation step-by-step with the conversion factor or exchange rate used.
 5. If the input is not a valid number or currency code, respond with an error message.
-6. For currency conversions, always use 3-letter currency codes (e.g., USD, EUR, GBP).
+6. For currency conversions, use 3-letter currency codes (e.g., USD, EUR, GBP). If the user names a currency by name or symbol (e.g., "yen", "rupees", "€"), resolve it with `resolve_currency` instead of listing currencies.
 </instructions>
 
 <tools>
 You have access to the following tools for unit and currency conversion:
-- Tool `convert_distance(value: float, from_unit: str, to_unit: str) -> float`: Converts distance between kilometers and miles.
-- Tool `convert_weight(value: float, from_unit: str, to_unit: str) -> float`: Converts weight between kilograms and pounds.
-- Tool `convert_temperature(value: float, from_unit: str, to_unit: str) -> float`: Converts temperature between Celsius and Fahrenheit.
+- Tool `convert_distance(value: float | list[float], from_unit: str | list[str], to_unit: str | list[str]) -> float | list[float]`: Converts distance between kilometers and miles.
+- Tool `convert_weight(value: float | list[float], from_unit: str | list[str], to_unit: str | list[str]) -> float | list[float]`: Converts weight between kilograms and pounds.
+- Tool `convert_temperature(value: float | list[float], from_unit: str | list[str], to_unit: str | list[str]) -> float | list[float]`: Converts temperature between Celsius and Fahrenheit.
 - Tool `convert_currency(amount: float, from_currency: str, to_currency: str) -> str`: Convert currency using real-time exchange rates.
+- Tool `convert_currency_multi(amounts: list[float], from_currencies: list[str], to_currencies: list[str]) -> str`: Convert one amount into many currencies, or many amounts into one currency, in a single call.
 - Tool `get_supported_currencies() -> str`: Get a list of supported currency codes for conversion.
+- Tool `resolve_currency(queries: list[str]) -> str`: Resolve currency names, plurals or symbols to ISO codes instantly.
 
 Use currency conversion tools when:
 - User asks to convert between different currencies (USD, EUR, GBP, JPY, etc.)
 - User wants to know current exchange rates
-- User needs to know what currency codes are supported
+- User needs to know what currency codes are supported (only when explicitly asked)
 
 Use unit conversion tools when:
 - User asks to convert distances (kilometers ↔ miles)
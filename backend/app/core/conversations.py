@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from app.core.config import CONVERSATION_MAX_CONVERSATIONS, CONVERSATION_MAX_MESSAGES, CONVERSATION_TTL
+from app.core.metrics import metrics
+
+# A conversation is private to the client that started it
+ConversationKey = tuple[str, str]
+
+
+class _Conversation:
+    def __init__(self, messages: list[BaseMessage]):
+        self.messages = messages
+        self.updated_at = time.monotonic()
+
+
+class ConversationStore:
+    """Message history of recent conversations, bounded in count and size and expired after a TTL.
+
+    Histories exclude the system prompt. Each is trimmed to its last
+    max_messages messages, cut at a user message so that no tool result
+    is kept without the model turn that called it.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = CONVERSATION_MAX_CONVERSATIONS,
+        max_messages: int = CONVERSATION_MAX_MESSAGES,
+        ttl: float = CONVERSATION_TTL,
+    ):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._conversations: OrderedDict[ConversationKey, _Conversation] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: ConversationKey) -> list[BaseMessage]:
+        """Return a copy of the conversation's history, empty if unknown or expired."""
+        with self._lock:
+            self._evict()
+            conversation = self._conversations.get(key)
+            return list(conversation.messages) if conversation else []
+
+    def save(self, key: ConversationKey, messages: list[BaseMessage]) -> None:
+        """Replace the conversation's history with messages, trimmed to max_messages."""
+        start = max(0, len(messages) - self.max_messages)
+        while start < len(messages) and not isinstance(messages[start], HumanMessage):
+            start += 1
+        with self._lock:
+            self._conversations.pop(key, None)
+            self._evict(room=1)
+            self._conversations[key] = _Conversation(messages[start:])
+            metrics.set_gauge("conversations", len(self._conversations))
+
+    def _evict(self, room: int = 0) -> None:
+        now = time.monotonic()
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            # Least recently saved first, so expired ones are always at the front
+            expired = now - conversation.updated_at > self.ttl
+            if not expired and len(self._conversations) + room <= self.max_conversations:
+                break
+            del self._conversations[key]
+
+
+def conversation_key(client_id: str, conversation_id: Optional[str]) -> Optional[ConversationKey]:
+    """Key of a request's conversation, or None for a one-off request without a conversation id."""
+    return (client_id, conversation_id) if conversation_id else None
+
+
+conversation_store = ConversationStore()
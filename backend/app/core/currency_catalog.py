@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from app.core.config import CURRENCY_CATALOG_TTL
+from app.core.http import get_json
+from app.core.rates import FREECURRENCY_API_URL, CurrencyAPIError, get_api_key
+
+# Currencies served by FreeCurrencyAPI, used until the first refresh succeeds
+DEFAULT_CURRENCIES = {
+    'AUD': 'Australian Dollar',
+    'BGN': 'Bulgarian Lev',
+    'BRL': 'Brazilian Real',
+    'CAD': 'Canadian Dollar',
+    'CHF': 'Swiss Franc',
+    'CNY': 'Chinese Yuan',
+    'CZK': 'Czech Koruna',
+    'DKK': 'Danish Krone',
+    'EUR': 'Euro',
+    'GBP': 'British Pound',
+    'HKD': 'Hong Kong Dollar',
+    'HUF': 'Hungarian Forint',
+    'IDR': 'Indonesian Rupiah',
+    'ILS': 'Israeli New Shekel',
+    'INR': 'Indian Rupee',
+    'ISK': 'Icelandic Krona',
+    'JPY': 'Japanese Yen',
+    'KRW': 'South Korean Won',
+    'MXN': 'Mexican Peso',
+    'MYR': 'Malaysian Ringgit',
+    'NOK': 'Norwegian Krone',
+    'NZD': 'New Zealand Dollar',
+    'PHP': 'Philippine Peso',
+    'PLN': 'Polish Zloty',
+    'RON': 'Romanian Leu',
+    'RUB': 'Russian Ruble',
+    'SEK': 'Swedish Krona',
+    'SGD': 'Singapore Dollar',
+    'THB': 'Thai Baht',
+    'TRY': 'Turkish Lira',
+    'USD': 'US Dollar',
+    'ZAR': 'South African Rand',
+}
+
+# Common names and symbols; these win over anything derived from the API data
+# since symbols such as $ and ¥ are shared by several currencies
+CURATED_ALIASES = {
+    '$': 'USD', 'us$': 'USD', 'dollar': 'USD', 'buck': 'USD', 'us dollar': 'USD', 'american dollar': 'USD',
+    '€': 'EUR', 'euro': 'EUR',
+    '£': 'GBP', 'pound': 'GBP', 'pound sterling': 'GBP', 'sterling': 'GBP', 'quid': 'GBP',
+    '¥': 'JPY', '円': 'JPY', 'yen': 'JPY', 'japanese yen': 'JPY',
+    '元': 'CNY', 'yuan': 'CNY', 'renminbi': 'CNY', 'rmb': 'CNY',
+    '₹': 'INR', 'rupee': 'INR', 'indian rupee': 'INR',
+    '₩': 'KRW', 'won': 'KRW',
+    '₽': 'RUB', 'ruble': 'RUB', 'rouble': 'RUB',
+    '₺': 'TRY', 'lira': 'TRY',
+    '₪': 'ILS', 'shekel': 'ILS',
+    '₱': 'PHP', 'philippine peso': 'PHP',
+    '฿': 'THB', 'baht': 'THB',
+    'zł': 'PLN', 'zloty': 'PLN',
+    'r$': 'BRL', 'real': 'BRL', 'reais': 'BRL',
+    'a$': 'AUD', 'aussie dollar': 'AUD',
+    'c$': 'CAD', 'canadian dollar': 'CAD', 'loonie': 'CAD',
+    'hk$': 'HKD', 'nz$': 'NZD', 's$': 'SGD',
+    'swiss franc': 'CHF', 'franc': 'CHF',
+    'peso': 'MXN', 'mexican peso': 'MXN',
+    'rand': 'ZAR', 'forint': 'HUF', 'ringgit': 'MYR', 'rupiah': 'IDR', 'koruna': 'CZK', 'lev': 'BGN',
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_alias(text: str) -> str:
+    """Normalize free text for alias lookup."""
+    return _WHITESPACE.sub(" ", text.strip().lower()).strip(" .")
+
+
+class CurrencyCatalog:
+    """Locally cached currency list with an alias index for constant-time resolution.
+
+    The catalog starts from DEFAULT_CURRENCIES and refreshes itself from the
+    API in a background thread once it is older than CURRENCY_CATALOG_TTL,
+    so lookups never wait on the network.
+    """
+
+    def __init__(self, ttl: float = CURRENCY_CATALOG_TTL):
+        self.ttl = ttl
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._build(DEFAULT_CURRENCIES, {})
+
+    @property
+    def currencies(self) -> dict[str, str]:
+        """Mapping of ISO code to currency name."""
+        self._refresh_if_stale()
+        return self._currencies
+
+    def resolve(self, text: str) -> Optional[str]:
+        """Resolve an ISO code, name, plural or symbol to an ISO code, or None."""
+        self._refresh_if_stale()
+        key = normalize_alias(text)
+        aliases = self._aliases
+        code = aliases.get(key)
+        if code is None and key.endswith("s"):
+            # Plurals such as "euros", "rupees" or "dollars"
+            code = aliases.get(key[:-1])
+        return code
+
+    def refresh(self) -> None:
+        """Reload the catalog from the API; keeps the current data on failure."""
+        try:
+            data = get_json(f"{FREECURRENCY_API_URL}/currencies", params={"apikey": get_api_key()})
+            currencies = data['data']
+        except (CurrencyAPIError, requests.RequestException, KeyError, TypeError, ValueError):
+            return
+        finally:
+            with self._lock:
+                self._refreshing = False
+                # Back off a full TTL after a failure too, instead of retrying on every lookup
+                self.refreshed_at = time.time()
+
+        names = {code: info.get('name', code) for code, info in currencies.items()}
+        self._build(names, currencies)
+
+    def _refresh_if_stale(self) -> None:
+        with self._lock:
+            if self._refreshing or time.time() - self.refreshed_at < self.ttl:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="currency-catalog-refresh", daemon=True).start()
+
+    def _build(self, names: dict[str, str], details: dict[str, dict]) -> None:
+        aliases: dict[str, str] = {}
+        for code, name in names.items():
+            info = details.get(code, {})
+            for alias in (name, info.get('name_plural'), info.get('symbol_native'), info.get('symbol')):
+                if alias:
+                    aliases.setdefault(normalize_alias(alias), code)
+        for alias, code in CURATED_ALIASES.items():
+            if code in names:
+                aliases[alias] = code
+        for code in names:
+            aliases[code.lower()] = code
+        # Swap whole dicts so concurrent readers never see a half-built index
+        self._currencies = dict(sorted(names.items()))
+        self._aliases = aliases
+
+
+catalog = CurrencyCatalog()
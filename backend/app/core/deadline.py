@@ -0,0 +1,112 @@
+import contextvars
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of its time budget."""
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish.
+
+    A deadline created with seconds=None never expires, so code can always
+    take a deadline instead of special-casing requests without one.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.budget = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, never negative, or None if unbounded."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if the deadline has passed."""
+        if self.expired:
+            raise DeadlineExceeded(f"Request deadline of {self.budget:g}s exceeded")
+
+    def timeout(self, default: Optional[float]) -> Optional[float]:
+        """Shrink a timeout to the remaining budget, raising if nothing is left."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+
+# Deadline of the request served by the current thread, for code that cannot receive it explicitly
+_current_deadline: ContextVar[Deadline] = ContextVar("current_deadline", default=Deadline())
+
+
+def current_deadline() -> Deadline:
+    return _current_deadline.get()
+
+
+@contextmanager
+def use_deadline(deadline: Deadline) -> Iterator[Deadline]:
+    """Make deadline current for the enclosed (non-generator) block."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+_DONE = object()
+
+
+def iterate_within(produce: Callable[[], Iterable[T]], deadline: Deadline) -> Iterator[T]:
+    """Iterate produce() but give up with DeadlineExceeded once deadline passes.
+
+    Blocking iterators such as model streams cannot be interrupted, so items
+    are pumped from a helper thread; when the deadline passes the consumer
+    stops waiting and the helper drops the rest of the stream.
+    """
+    if deadline.remaining() is None:
+        yield from produce()
+        return
+
+    items: queue.Queue = queue.Queue()
+    abandoned = threading.Event()
+
+    def pump() -> None:
+        try:
+            for item in produce():
+                if abandoned.is_set():
+                    return
+                items.put((item, None))
+        except BaseException as e:
+            items.put((_DONE, e))
+            return
+        items.put((_DONE, None))
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(pump,), name="deadline-pump", daemon=True).start()
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=deadline.timeout(None))
+            except queue.Empty:
+                deadline.check()
+                continue
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        abandoned.set()
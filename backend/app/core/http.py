@@ -0,0 +1,22 @@
+from typing import Any, Optional
+
+import requests
+
+from app.core.deadline import current_deadline
+from app.core.tracing import child_span
+
+
+def get_json(url: str, params: Optional[dict[str, Any]] = None, timeout: float = 10) -> Any:
+    """GET url and decode its JSON body, recorded as a span of the current trace.
+
+    The timeout is shrunk to the remaining budget of the current request
+    deadline. Raises requests.RequestException for network errors and non-2xx
+    responses, and DeadlineExceeded if no budget is left.
+    """
+    timeout = current_deadline().timeout(timeout)
+    # Params are left out of the span since they may carry API keys
+    with child_span("http.get", url=url, timeout=timeout) as span:
+        response = requests.get(url, params=params, timeout=timeout)
+        span.set_attribute("status_code", response.status_code)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,32 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Thread-safe in-process counters and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Add value to the named counter."""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Set the named gauge to value."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self) -> dict:
+        """Return a copy of all counters and gauges."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+
+metrics = Metrics()
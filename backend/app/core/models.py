@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -9,7 +9,84 @@ class ContentChunk:
 
 @dataclass
 class ToolExecution:
-    """Represents the execution of a tool."""
+    """Represents the execution of a tool.
+
+    result is the compact content the model sees; formatted_result is the
+    markdown rendering shown to the user.
+    """
     name: str
     args: dict
     result: str
+    formatted_result: str
+
+
+@dataclass
+class StreamReset:
+    """Signals that partially streamed content must be discarded before a retry."""
+    attempt: int
+    reason: str
+
+
+@dataclass
+class BulkConversionStats:
+    """Progress and throughput of a bulk CSV currency conversion."""
+    target_currency: str
+    rows: int = 0
+    invalid_rows: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+
+@dataclass
+class DeadlineReached:
+    """Signals that the request deadline passed before the agent finished."""
+    reason: str
+    partial_answer: str
+
+
+@dataclass
+class TokenUsage:
+    """Token counts for one or more model calls."""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    model_calls: int = 0
+    # Model calls whose provider reported no usage, so counts were estimated locally
+    estimated_calls: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other: "TokenUsage") -> None:
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cached_tokens += other.cached_tokens
+        self.model_calls += other.model_calls
+        self.estimated_calls += other.estimated_calls
+
+
+@dataclass
+class PromptBreakdown:
+    """Estimated prompt tokens by source, summed over model calls."""
+    system_tokens: int = 0
+    history_tokens: int = 0
+    tool_result_tokens: int = 0
+
+    def add(self, other: "PromptBreakdown") -> None:
+        self.system_tokens += other.system_tokens
+        self.history_tokens += other.history_tokens
+        self.tool_result_tokens += other.tool_result_tokens
+
+
+@dataclass
+class AgentStats:
+    """Summary of the work done by the agent for one request."""
+    iterations: int = 0
+    tool_calls: int = 0
+    tool_calls_saved: int = 0
+    iterations_remaining: int = 0
+    loop_detected: bool = False
+    usage: TokenUsage = field(default_factory=TokenUsage)
+    prompt: PromptBreakdown = field(default_factory=PromptBreakdown)
@@ -0,0 +1,215 @@
+import importlib
+import logging
+import multiprocessing
+import queue
+import threading
+from multiprocessing.connection import Connection
+from typing import Any, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits are skipped there
+    resource = None
+
+from app.core.config import CPU_TOOL_CPU_SECONDS, CPU_TOOL_MEMORY_MB, CPU_TOOL_TIMEOUT, CPU_TOOL_WORKERS
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a spawned worker may take to import the tools
+WORKER_START_TIMEOUT = 60
+
+# Module whose available_tools the workers serve
+TOOLS_MODULE = "app.tools.conversion_tools"
+
+
+class ToolProcessError(Exception):
+    """Raised when a tool fails, times out or is killed in the process pool."""
+
+
+def _worker_main(conn: Connection, cpu_seconds: float, memory_mb: int, tools_module: str = TOOLS_MODULE) -> None:
+    """Serve (tool name, args) requests from the parent until the pipe closes."""
+    # Imported here so the parent never pays for it and spawned workers load tools once
+    tools = {tool.name: tool for tool in importlib.import_module(tools_module).available_tools}
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            name, args = conn.recv()
+        except EOFError:
+            return
+        if resource is not None and cpu_seconds > 0:
+            # RLIMIT_CPU is cumulative, so allow cpu_seconds on top of what was used so far;
+            # exceeding it makes the kernel kill the worker with SIGXCPU
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (used + int(max(1, cpu_seconds)), hard))
+        try:
+            conn.send(("ok", tools[name].invoke(args)))
+        except MemoryError:
+            conn.send(("error", f"Tool {name} exceeded the {memory_mb} MB memory limit"))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class _Worker:
+    """One warm worker process and the parent end of its pipe."""
+
+    def __init__(self, context, cpu_seconds: float, memory_mb: int, tools_module: str = TOOLS_MODULE):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, memory_mb, tools_module),
+            name="tool-worker",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout: float) -> None:
+        """Block until the worker has imported the tools and can take calls."""
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise ToolProcessError(f"Tool worker did not start within {timeout:g}s")
+        try:
+            self.conn.recv()
+        except (EOFError, OSError):
+            # The worker exited before reporting ready, e.g. it failed to import the tools
+            self.kill()
+            raise ToolProcessError(f"Tool worker exited during startup (exit code {self.process.exitcode})")
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ToolProcessPool:
+    """Warm pool of worker processes for CPU-bound tools.
+
+    Each call gets a CPU-time limit and a hard wall-clock timeout; a worker
+    that overruns either is killed and replaced in the background, so a
+    runaway computation never blocks request threads or holds the GIL of the
+    server process.
+    """
+
+    def __init__(
+        self,
+        workers: int = CPU_TOOL_WORKERS,
+        timeout: float = CPU_TOOL_TIMEOUT,
+        cpu_seconds: float = CPU_TOOL_CPU_SECONDS,
+        memory_mb: int = CPU_TOOL_MEMORY_MB,
+        tools_module: str = TOOLS_MODULE,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.tools_module = tools_module
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        # Set when the workers could not be started; CPU-bound tools then run inline
+        self._failed = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and not self._failed
+
+    def start(self) -> None:
+        """Spawn the workers so the first tool call does not pay for process startup.
+
+        If a worker fails to start, the pool is disabled and CPU-bound tools
+        fall back to running inline instead of failing every call.
+        """
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            # Start every worker before waiting so they import the tools in parallel
+            workers = [self._new_worker() for _ in range(self.workers)]
+            try:
+                for worker in workers:
+                    worker.wait_ready(WORKER_START_TIMEOUT)
+            except ToolProcessError:
+                logger.exception("Tool process pool failed to start; running CPU-bound tools inline")
+                metrics.increment("cpu_tool_pool_start_failures")
+                for worker in workers:
+                    worker.kill()
+                self._failed = True
+                return
+            for worker in workers:
+                self._idle.put(worker)
+            self._started = True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            while not self._idle.empty():
+                self._idle.get_nowait().kill()
+            self._started = False
+
+    def run(self, name: str, args: dict, timeout: Optional[float] = None) -> Any:
+        """Run tool name with args in a worker and return its result."""
+        self.start()
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            metrics.increment("cpu_tool_timeouts")
+            raise ToolProcessError(f"No worker available for tool {name} within {timeout:g}s")
+
+        try:
+            worker.conn.send((name, args))
+            finished = worker.conn.poll(timeout)
+            if finished:
+                status, result = worker.conn.recv()
+        except (EOFError, OSError):
+            # The worker died, most likely killed for exceeding its CPU-time limit
+            metrics.increment("cpu_tool_crashes")
+            self._replace(worker)
+            raise ToolProcessError(f"Tool {name} was terminated (CPU limit {self.cpu_seconds:g}s)")
+        if not finished:
+            metrics.increment("cpu_tool_timeouts")
+            self._replace(worker)
+            raise ToolProcessError(f"Tool {name} timed out after {timeout:g}s and was killed")
+        # Only a worker that answered goes back to the pool
+        self._idle.put(worker)
+
+        metrics.increment("cpu_tool_calls")
+        if status == "error":
+            raise ToolProcessError(result)
+        return result
+
+    def _new_worker(self) -> _Worker:
+        return _Worker(self._context, self.cpu_seconds, self.memory_mb, self.tools_module)
+
+    def _replace(self, worker: _Worker) -> None:
+        """Kill worker and start its replacement in the background.
+
+        Spawning can take seconds, which must not count against the
+        request whose tool call failed.
+        """
+        worker.kill()
+        threading.Thread(target=self._respawn, name="tool-worker-respawn", daemon=True).start()
+
+    def _respawn(self) -> None:
+        try:
+            worker = self._new_worker()
+            worker.wait_ready(WORKER_START_TIMEOUT)
+        except ToolProcessError:
+            logger.exception("Could not replace a tool worker; the pool runs one worker short")
+            metrics.increment("cpu_tool_respawn_failures")
+            return
+        with self._lock:
+            if not self._started:
+                # The pool was shut down while the replacement started
+                worker.kill()
+                return
+            self._idle.put(worker)
+
+
+tool_process_pool = ToolProcessPool()
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from app.core.config import (
+    RATE_API_QUOTA_PER_HOUR,
+    RATE_CACHE_TTL,
+    RATE_HOT_HALF_LIFE,
+    RATE_REFRESH_LEAD,
+    RATE_REFRESH_MAX_BASES,
+    RATE_REFRESH_QUOTA_SHARE,
+)
+from app.core.http import get_json
+from app.core.metrics import metrics
+from app.core.tracing import child_span
+
+FREECURRENCY_API_URL = "https://api.freecurrencyapi.com/v1"
+
+# Longest the refresh scheduler sleeps, so newly hot bases are picked up promptly
+SCHEDULER_MAX_SLEEP = 60
+
+logger = logging.getLogger(__name__)
+
+
+class CurrencyAPIError(Exception):
+    """Raised when exchange rates cannot be obtained from the currency API."""
+
+
+def get_api_key() -> str:
+    """Return the FreeCurrencyAPI key or raise CurrencyAPIError if it is not set."""
+    api_key = os.getenv("FREECURRENCY_API_KEY")
+    if not api_key:
+        raise CurrencyAPIError(
+            "Currency conversion API key not found. Please set the FREECURRENCY_API_KEY "
+            "environment variable with your API key from https://freecurrencyapi.com/"
+        )
+    return api_key
+
+
+def fetch_latest_rates(base_currency: str) -> dict[str, float]:
+    """Fetch the latest rates of every supported currency for base_currency in a single API call.
+
+    Returns a mapping of currency code to units of that currency per one unit
+    of base_currency, always including base_currency itself at 1.0.
+    """
+    params = {"apikey": get_api_key(), "base_currency": base_currency}
+    try:
+        data = get_json(f"{FREECURRENCY_API_URL}/latest", params=params)
+    except requests.RequestException as e:
+        raise CurrencyAPIError(f"Unable to fetch exchange rates due to network error: {str(e)}") from e
+
+    if 'error' in data:
+        raise CurrencyAPIError(data['error'].get('message', 'Unknown API error'))
+    if 'data' not in data:
+        raise CurrencyAPIError("Invalid response format from currency API")
+
+    rates = {code: float(rate) for code, rate in data['data'].items()}
+    rates[base_currency] = 1.0
+    return rates
+
+
+@dataclass
+class RateSnapshot:
+    """All rates quoted from one base currency, as fetched at fetched_at."""
+    base_currency: str
+    rates: dict[str, float]
+    fetched_at: float
+    expires_at: float
+
+
+class RateCache:
+    """Per-base-currency cache of the latest rates with hot-base tracking.
+
+    One fetch per base covers every pair quoted from it. Each lookup adds to
+    an exponentially decaying request count for its base, which the refresh
+    scheduler uses to pick the bases worth keeping warm, and every upstream
+    call is timestamped so refreshes can be kept within the API quota.
+    """
+
+    def __init__(self, ttl: float = RATE_CACHE_TTL, half_life: float = RATE_HOT_HALF_LIFE):
+        self.ttl = ttl
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._entries: dict[str, RateSnapshot] = {}
+        self._fetch_locks: dict[str, threading.Lock] = {}
+        # base currency -> (decayed request count, time it was last decayed)
+        self._scores: dict[str, tuple[float, float]] = {}
+        self._calls: deque[float] = deque()
+
+    def get(self, base_currency: str) -> RateSnapshot:
+        """Return fresh rates for base_currency, fetching them on a miss.
+
+        Concurrent misses for the same base share a single upstream call.
+        Raises CurrencyAPIError if the rates cannot be fetched.
+        """
+        base_currency = base_currency.upper().strip()
+        self._record_request(base_currency)
+        with child_span("rates.get", base_currency=base_currency) as span:
+            snapshot = self._fresh(base_currency)
+            if snapshot is None:
+                with self._fetch_lock(base_currency):
+                    # Another request may have fetched it while this one waited
+                    snapshot = self._fresh(base_currency)
+                    if snapshot is None:
+                        metrics.increment("rate_cache_misses")
+                        span.set_attribute("cached", False)
+                        return self._fetch(base_currency)
+            metrics.increment("rate_cache_hits")
+            span.set_attribute("cached", True)
+            return snapshot
+
+    def refresh(self, base_currency: str) -> RateSnapshot:
+        """Fetch base_currency now, replacing any cached rates."""
+        with self._fetch_lock(base_currency):
+            return self._fetch(base_currency)
+
+    def expires_at(self, base_currency: str) -> Optional[float]:
+        """Time the cached rates for base_currency expire, or None if there are none."""
+        snapshot = self._entries.get(base_currency)
+        return snapshot.expires_at if snapshot else None
+
+    def hot_bases(self, limit: int) -> list[str]:
+        """Return up to limit bases requested within about the last half-life, hottest first."""
+        now = time.time()
+        with self._lock:
+            scores = {base: self._decayed(score, updated_at, now) for base, (score, updated_at) in self._scores.items()}
+            # Forget bases nobody has asked for in many half-lives
+            for base, score in scores.items():
+                if score < 0.01:
+                    del self._scores[base]
+        hot = sorted((base for base, score in scores.items() if score >= 0.5), key=scores.get, reverse=True)
+        return hot[:limit]
+
+    def calls_last_hour(self) -> int:
+        """Number of upstream rate fetches in the last hour."""
+        with self._lock:
+            self._prune_calls(time.time())
+            return len(self._calls)
+
+    def _fresh(self, base_currency: str) -> Optional[RateSnapshot]:
+        snapshot = self._entries.get(base_currency)
+        if snapshot is not None and snapshot.expires_at > time.time():
+            return snapshot
+        return None
+
+    def _fetch(self, base_currency: str) -> RateSnapshot:
+        with self._lock:
+            now = time.time()
+            self._prune_calls(now)
+            self._calls.append(now)
+        metrics.increment("rate_fetches")
+        rates = fetch_latest_rates(base_currency)
+        fetched_at = time.time()
+        snapshot = RateSnapshot(base_currency, rates, fetched_at, fetched_at + self.ttl)
+        self._entries[base_currency] = snapshot
+        return snapshot
+
+    def _fetch_lock(self, base_currency: str) -> threading.Lock:
+        with self._lock:
+            return self._fetch_locks.setdefault(base_currency, threading.Lock())
+
+    def _record_request(self, base_currency: str) -> None:
+        now = time.time()
+        with self._lock:
+            score, updated_at = self._scores.get(base_currency, (0.0, now))
+            self._scores[base_currency] = (self._decayed(score, updated_at, now) + 1, now)
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * math.pow(0.5, (now - updated_at) / self.half_life)
+
+    def _prune_calls(self, now: float) -> None:
+        while self._calls and self._calls[0] <= now - 3600:
+            self._calls.popleft()
+
+
+class RateRefreshScheduler:
+    """Refresh-ahead loop that keeps the hottest base currencies warm.
+
+    Each hot base is refetched lead seconds before its cached rates expire.
+    When quota_share of the hourly quota cannot cover that for every hot base,
+    the per-base interval is stretched until it can and the hottest bases are
+    refreshed first, leaving the rest of the quota for cache misses.
+    """
+
+    def __init__(
+        self,
+        cache: RateCache,
+        quota_per_hour: int = RATE_API_QUOTA_PER_HOUR,
+        quota_share: float = RATE_REFRESH_QUOTA_SHARE,
+        lead: float = RATE_REFRESH_LEAD,
+        max_bases: int = RATE_REFRESH_MAX_BASES,
+    ):
+        self.cache = cache
+        self.quota_per_hour = quota_per_hour
+        self.budget_per_hour = quota_per_hour * quota_share
+        self.lead = min(lead, cache.ttl / 2)
+        self.max_bases = max_bases
+        self._refreshed_at: dict[str, float] = {}
+        self._refreshes: deque[float] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bases > 0 and self.budget_per_hour >= 1
+
+    def start(self) -> None:
+        """Start the refresh loop on the running event loop."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="rate-refresh")
+
+    async def stop(self) -> None:
+        """Cancel the refresh loop and wait for it to finish."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    def refresh_interval(self, hot_count: int) -> float:
+        """Seconds between refreshes of one base so hot_count bases fit in the budget."""
+        return max(self.cache.ttl - self.lead, 3600 * hot_count / self.budget_per_hour)
+
+    def tick(self) -> float:
+        """Refresh every hot base that is due and return the seconds until the next one is."""
+        now = time.time()
+        hot = self.cache.hot_bases(self.max_bases)
+        interval = self.refresh_interval(len(hot))
+        next_due = math.inf
+        for base in hot:
+            due = self._due_at(base, interval)
+            if due <= now and self._has_budget(now):
+                self._refresh(base, now)
+                due = self._due_at(base, interval)
+            next_due = min(next_due, due)
+            now = time.time()
+
+        if self._refreshes and not self._has_budget(now):
+            # Out of budget: wake when the oldest refresh leaves the quota window
+            next_due = max(next_due, self._refreshes[0] + 3600)
+        metrics.set_gauge("rates_hot_bases", len(hot))
+        metrics.set_gauge("rates_refresh_interval_seconds", interval)
+        metrics.set_gauge("rate_api_calls_last_hour", self.cache.calls_last_hour())
+        metrics.set_gauge("rates_next_refresh_at", next_due if next_due < math.inf else 0)
+        metrics.set_gauge("rates_next_refresh_in_seconds", max(0.0, next_due - now) if next_due < math.inf else -1)
+        return min(max(next_due - now, 1.0), SCHEDULER_MAX_SLEEP)
+
+    def _due_at(self, base_currency: str, interval: float) -> float:
+        expires_at = self.cache.expires_at(base_currency) or 0.0
+        return max(expires_at - self.lead, self._refreshed_at.get(base_currency, 0.0) + interval)
+
+    def _has_budget(self, now: float) -> bool:
+        while self._refreshes and self._refreshes[0] <= now - 3600:
+            self._refreshes.popleft()
+        return len(self._refreshes) < self.budget_per_hour and self.cache.calls_last_hour() < self.quota_per_hour
+
+    def _refresh(self, base_currency: str, now: float) -> None:
+        self._refreshes.append(now)
+        # Set even on failure so a failing base waits a full interval before the next attempt
+        self._refreshed_at[base_currency] = now
+        try:
+            self.cache.refresh(base_currency)
+            metrics.increment("rate_refreshes")
+        except CurrencyAPIError as e:
+            metrics.increment("rate_refresh_failures")
+            logger.warning("Refreshing %s rates failed: %s", base_currency, e)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delay = await asyncio.to_thread(self.tick)
+            except Exception:
+                logger.exception("Rate refresh scheduler tick failed")
+                delay = SCHEDULER_MAX_SLEEP
+            await asyncio.sleep(delay)
+
+
+rate_cache = RateCache()
+rate_refresh_scheduler = RateRefreshScheduler(rate_cache)
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Iterator, Optional
+
+from app.core.config import (
+    SESSION_BUFFER_MAX_BYTES,
+    SESSION_BUFFER_MAX_EVENTS,
+    SESSION_KEEPALIVE_SECONDS,
+    SESSION_MAX_SESSIONS,
+    SESSION_TTL,
+)
+from app.core.metrics import metrics
+
+
+class EventBuffer:
+    """Recent SSE events of one session, appended by the producer and replayed to clients.
+
+    Events are numbered from 1. The buffer keeps at most max_events events
+    and max_bytes of event data, dropping the oldest first.
+    """
+
+    def __init__(self, session_id: str, max_events: int = SESSION_BUFFER_MAX_EVENTS, max_bytes: int = SESSION_BUFFER_MAX_BYTES):
+        self.session_id = session_id
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.closed = False
+        self.updated_at = time.monotonic()
+        self._events: deque[tuple[int, str]] = deque()
+        self._size = 0
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    def append(self, data: str) -> int:
+        """Add an event payload and return its id."""
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, data))
+            self._size += len(data)
+            while self._events and (len(self._events) > self.max_events or self._size > self.max_bytes):
+                _, dropped = self._events.popleft()
+                self._size -= len(dropped)
+            self.updated_at = time.monotonic()
+            self._condition.notify_all()
+            return self._last_id
+
+    def close(self) -> None:
+        """Mark the session complete; readers stop once they have drained the buffer."""
+        with self._condition:
+            self.closed = True
+            self.updated_at = time.monotonic()
+            self._condition.notify_all()
+
+    def stream(self, after: int = 0) -> Iterator[str]:
+        """Yield SSE frames for events with id > after, waiting for new ones until closed.
+
+        If events after `after` were already evicted, the stream continues from
+        the oldest retained event. A comment frame is sent while idle to keep
+        intermediaries from dropping the connection.
+        """
+        while True:
+            with self._condition:
+                pending = [event for event in self._events if event[0] > after]
+                if not pending:
+                    if self.closed:
+                        return
+                    self._condition.wait(timeout=SESSION_KEEPALIVE_SECONDS)
+                    pending = [event for event in self._events if event[0] > after]
+            if not pending:
+                yield ": keepalive\n\n"
+                continue
+            for event_id, data in pending:
+                yield f"id: {event_id}\n{data}"
+            after = pending[-1][0]
+
+
+class SessionStore:
+    """Event buffers of recent sessions, bounded in count and expired after a TTL."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, EventBuffer] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str) -> EventBuffer:
+        buffer = EventBuffer(session_id)
+        with self._lock:
+            self._evict()
+            self._sessions[session_id] = buffer
+            metrics.set_gauge("sse_sessions", len(self._sessions))
+        return buffer
+
+    def get(self, session_id: str) -> Optional[EventBuffer]:
+        with self._lock:
+            self._evict()
+            return self._sessions.get(session_id)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [
+            session_id for session_id, buffer in self._sessions.items()
+            if buffer.closed and now - buffer.updated_at > self.ttl
+        ]
+        for session_id in expired:
+            del self._sessions[session_id]
+        # Over capacity: drop the oldest sessions, preferring ones that have finished
+        while len(self._sessions) >= self.max_sessions:
+            victim = next((sid for sid, buffer in self._sessions.items() if buffer.closed), None)
+            if victim is None:
+                victim = next(iter(self._sessions))
+            del self._sessions[victim]
+
+
+session_store = SessionStore()
@@ -0,0 +1,168 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from logging.handlers import RotatingFileHandler
+from typing import Any, Iterator, Optional
+
+from app.core.config import (
+    TRACE_BUFFER_SIZE,
+    TRACE_FILE,
+    TRACE_FILE_BACKUP_COUNT,
+    TRACE_FILE_MAX_BYTES,
+    TRACE_SAMPLE_RATE,
+)
+
+
+@dataclass
+class Span:
+    """A timed unit of work within a trace."""
+    name: str
+    trace: "Trace" = field(repr=False)
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    status: str = "ok"
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute to the span."""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end is None:
+            return None
+        return round((self.end - self.start) * 1000, 3)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """All spans recorded for one request.
+
+    Parents are passed explicitly because request handling runs inside
+    generators that resume on different threads, where context variables set
+    by an earlier step are not visible.
+    """
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes: Any) -> Iterator[Span]:
+        """Record a span around the enclosed block."""
+        span = Span(
+            name=name,
+            trace=self,
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        if self.sampled:
+            with self._lock:
+                self.spans.append(span)
+        try:
+            yield span
+        except GeneratorExit:
+            # The client went away while a streaming response was suspended here
+            span.status = "cancelled"
+            raise
+        except BaseException as e:
+            span.status = "error"
+            span.set_attribute("error", repr(e))
+            raise
+        finally:
+            span.end = time.time()
+
+    def to_tree(self) -> list[dict]:
+        """Return the recorded spans nested under their parents."""
+        with self._lock:
+            nodes = {span.span_id: {**span.to_dict(), "children": []} for span in self.spans}
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node["parent_id"])
+            (parent["children"] if parent else roots).append(node)
+        return roots
+
+
+# Span active on the current thread, used by code that cannot receive a parent explicitly
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Make span the current span for the enclosed (non-generator) block."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def child_span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Record a child of the current span, or an unrecorded span if there is none."""
+    parent = _current_span.get()
+    trace = parent.trace if parent else Trace(trace_id="", sampled=False)
+    with trace.span(name, parent=parent, **attributes) as span, use_span(span):
+        yield span
+
+
+class Tracer:
+    """Samples request traces into a bounded in-memory ring buffer and an optional JSONL file."""
+
+    def __init__(self, buffer_size: int, sample_rate: float, file_path: str = ""):
+        self.buffer_size = buffer_size
+        self.sample_rate = sample_rate
+        self._traces: OrderedDict[str, Trace] = OrderedDict()
+        self._lock = threading.Lock()
+        self._file_logger: Optional[logging.Logger] = None
+        if file_path:
+            handler = RotatingFileHandler(file_path, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file_logger = logging.getLogger("app.traces")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+
+    def start_trace(self, trace_id: str) -> Trace:
+        """Begin a trace; sampled traces are visible in the buffer while still running."""
+        trace = Trace(trace_id=trace_id, sampled=random.random() < self.sample_rate)
+        if trace.sampled:
+            with self._lock:
+                self._traces[trace_id] = trace
+                while len(self._traces) > self.buffer_size:
+                    self._traces.popitem(last=False)
+        return trace
+
+    def finish_trace(self, trace: Trace) -> None:
+        """Persist a completed trace to the JSONL file if one is configured."""
+        if trace.sampled and self._file_logger:
+            self._file_logger.info(json.dumps({"trace_id": trace.trace_id, "spans": trace.to_tree()}, default=str))
+
+    def get_trace(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+
+tracer = Tracer(buffer_size=TRACE_BUFFER_SIZE, sample_rate=TRACE_SAMPLE_RATE, file_path=TRACE_FILE)
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, ToolMessage
+
+from app.core.config import USAGE_SESSION_LIMIT
+from app.core.metrics import metrics
+from app.core.models import PromptBreakdown, TokenUsage
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Load the tiktoken encoding once; None if tiktoken is unavailable."""
+    global _encoding, tiktoken
+    if tiktoken is None:
+        return None
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # The encoding could not be loaded (e.g. offline); fall back for good
+                tiktoken = None
+                return None
+        return _encoding
+
+
+def estimate_tokens(text: Any) -> int:
+    """Estimate the token count of text with a local tokenizer.
+
+    Uses tiktoken when installed, otherwise roughly four characters per token.
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = str(text)
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    tokens = estimate_tokens(message.content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        tokens += estimate_tokens([(call['name'], call['args']) for call in message.tool_calls])
+    return tokens
+
+
+def prompt_breakdown(messages: list[BaseMessage]) -> PromptBreakdown:
+    """Estimate how many prompt tokens come from the system prompt, conversation and tool results."""
+    breakdown = PromptBreakdown()
+    for message in messages:
+        tokens = _message_tokens(message)
+        if isinstance(message, SystemMessage):
+            breakdown.system_tokens += tokens
+        elif isinstance(message, ToolMessage):
+            breakdown.tool_result_tokens += tokens
+        else:
+            breakdown.history_tokens += tokens
+    return breakdown
+
+
+def usage_from_response(
+    usage_metadata: Optional[dict], breakdown: PromptBreakdown, response: Optional[AIMessage]
+) -> TokenUsage:
+    """Token usage of one model call, from provider metadata or a local estimate."""
+    if usage_metadata:
+        return TokenUsage(
+            input_tokens=usage_metadata.get('input_tokens', 0),
+            output_tokens=usage_metadata.get('output_tokens', 0),
+            cached_tokens=(usage_metadata.get('input_token_details') or {}).get('cache_read', 0),
+            model_calls=1,
+        )
+    prompt_tokens = breakdown.system_tokens + breakdown.history_tokens + breakdown.tool_result_tokens
+    return TokenUsage(
+        input_tokens=prompt_tokens,
+        output_tokens=_message_tokens(response) if response is not None else 0,
+        model_calls=1,
+        estimated_calls=1,
+    )
+
+
+class UsageTracker:
+    """Aggregates token usage per session (bounded, least recently used evicted) and globally."""
+
+    def __init__(self, session_limit: int):
+        self.session_limit = session_limit
+        self._sessions: OrderedDict[str, TokenUsage] = OrderedDict()
+        self._total = TokenUsage()
+        self._prompt = PromptBreakdown()
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, usage: TokenUsage, prompt: PromptBreakdown) -> TokenUsage:
+        """Add a request's usage and return the updated session total."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or TokenUsage()
+            session.add(usage)
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.session_limit:
+                self._sessions.popitem(last=False)
+            self._total.add(usage)
+            self._prompt.add(prompt)
+            session_total = TokenUsage(**asdict(session))
+
+        metrics.increment("tokens_input", usage.input_tokens)
+        metrics.increment("tokens_output", usage.output_tokens)
+        metrics.increment("tokens_cached", usage.cached_tokens)
+        return session_total
+
+    def get_session(self, session_id: str) -> Optional[TokenUsage]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return TokenUsage(**asdict(session)) if session else None
+
+    def snapshot(self) -> dict:
+        """Global totals and prompt breakdown."""
+        with self._lock:
+            return {
+                "total": {**asdict(self._total), "total_tokens": self._total.total_tokens},
+                "prompt": asdict(self._prompt),
+                "sessions": len(self._sessions),
+            }
+
+
+usage_tracker = UsageTracker(session_limit=USAGE_SESSION_LIMIT)
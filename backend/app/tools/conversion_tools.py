@@ -1,7 +1,8 @@
 from enum import StrEnum
+import numpy as np
 from langchain_core.tools import tool
 from app.core.config import KM_TO_MILES, KG_TO_LBS
-from app.tools.currency_tools import convert_currency, get_supported_currencies
+from app.tools.currency_tools import convert_currency, convert_currency_multi, get_supported_currencies, resolve_currency
 
 
 class WeightUnit(StrEnum):
@@ -19,64 +20,126 @@ class TemperatureUnit(StrEnum):
     FAHRENHEIT = "fahrenheit"
 
 
+# Each supported unit pair maps to (scale, offset) so that result = value * scale + offset
+DISTANCE_FACTORS = {
+    (DistanceUnit.KM, DistanceUnit.MILES): (KM_TO_MILES, 0.0),
+    (DistanceUnit.MILES, DistanceUnit.KM): (1 / KM_TO_MILES, 0.0),
+}
+
+WEIGHT_FACTORS = {
+    (WeightUnit.KG, WeightUnit.LBS): (KG_TO_LBS, 0.0),
+    (WeightUnit.LBS, WeightUnit.KG): (1 / KG_TO_LBS, 0.0),
+}
+
+TEMPERATURE_FACTORS = {
+    (TemperatureUnit.CELSIUS, TemperatureUnit.FAHRENHEIT): (9 / 5, 32.0),
+    (TemperatureUnit.FAHRENHEIT, TemperatureUnit.CELSIUS): (5 / 9, -32 * 5 / 9),
+}
+
+
+def _per_value(units: str | list[str], count: int) -> np.ndarray:
+    """Broadcast a single unit, or a one-element list, to one unit per value."""
+    if isinstance(units, str):
+        units = [units]
+    if len(units) == 1:
+        units = units * count
+    if len(units) != count:
+        raise ValueError(f"Expected 1 or {count} units, got {len(units)}")
+    return np.array([str(unit) for unit in units])
+
+
+def convert_linear(
+    value: float | list[float],
+    from_unit: str | list[str],
+    to_unit: str | list[str],
+    factors: dict[tuple[str, str], tuple[float, float]],
+    quantity: str,
+) -> float | list[float]:
+    """Convert one value or a list of values in a single vectorized operation.
+
+    Units may be given once for all values or once per value, so mixed unit
+    pairs are converted together. A single value returns a float, a list
+    returns a list in the same order.
+    """
+    values = np.atleast_1d(np.asarray(value, dtype=float))
+    from_units = _per_value(from_unit, len(values))
+    to_units = _per_value(to_unit, len(values))
+
+    scale = np.full(len(values), np.nan)
+    offset = np.zeros(len(values))
+    for (source, target), (pair_scale, pair_offset) in factors.items():
+        mask = (from_units == source) & (to_units == target)
+        scale[mask] = pair_scale
+        offset[mask] = pair_offset
+    unsupported = np.flatnonzero(np.isnan(scale))
+    if len(unsupported):
+        index = unsupported[0]
+        raise ValueError(f"Unsupported {quantity} conversion from {from_units[index]} to {to_units[index]}")
+
+    result = values * scale + offset
+    return float(result[0]) if np.ndim(value) == 0 else result.tolist()
+
+
 @tool
-def convert_distance(value: float, from_unit: DistanceUnit, to_unit: DistanceUnit) -> float:
+def convert_distance(
+    value: float | list[float],
+    from_unit: DistanceUnit | list[DistanceUnit],
+    to_unit: DistanceUnit | list[DistanceUnit],
+) -> float | list[float]:
     """Convert distance between kilometers and miles.
     
     Args:
-        value: The numeric value to convert
-        from_unit: The source unit (km or miles)
-        to_unit: The target unit (km or miles)
+        value: The numeric value to convert, or a list of values to convert in one call
+        from_unit: The source unit (km or miles), or one source unit per value
+        to_unit: The target unit (km or miles), or one target unit per value
         
     Returns:
-        The converted distance value
+        The converted distance value, or a list of converted values in input order
     """
-    if from_unit == DistanceUnit.KM and to_unit == DistanceUnit.MILES:
-        return value * KM_TO_MILES
-    elif from_unit == DistanceUnit.MILES and to_unit == DistanceUnit.KM:
-        return value / KM_TO_MILES
-    else:
-        raise ValueError(f"Unsupported distance conversion from {from_unit} to {to_unit}")
+    return convert_linear(value, from_unit, to_unit, DISTANCE_FACTORS, "distance")
 
 
 @tool
-def convert_weight(value: float, from_unit: WeightUnit, to_unit: WeightUnit) -> float:
+def convert_weight(
+    value: float | list[float],
+    from_unit: WeightUnit | list[WeightUnit],
+    to_unit: WeightUnit | list[WeightUnit],
+) -> float | list[float]:
     """Convert weight between kilograms and pounds.
     
     Args:
-        value: The numeric value to convert
-        from_unit: The source unit (kg or lbs)
-        to_unit: The target unit (kg or lbs)
+        value: The numeric value to convert, or a list of values to convert in one call
+        from_unit: The source unit (kg or lbs), or one source unit per value
+        to_unit: The target unit (kg or lbs), or one target unit per value
         
     Returns:
-        The converted weight value
+        The converted weight value, or a list of converted values in input order
     """
-    if from_unit == WeightUnit.KG and to_unit == WeightUnit.LBS:
-        return value * KG_TO_LBS
-    elif from_unit == WeightUnit.LBS and to_unit == WeightUnit.KG:
-        return value / KG_TO_LBS
-    else:
-        raise ValueError(f"Unsupported weight conversion from {from_unit} to {to_unit}")
+    return convert_linear(value, from_unit, to_unit, WEIGHT_FACTORS, "weight")
 
 
 @tool
-def convert_temperature(value: float, from_unit: TemperatureUnit, to_unit: TemperatureUnit) -> float:
+def convert_temperature(
+    value: float | list[float],
+    from_unit: TemperatureUnit | list[TemperatureUnit],
+    to_unit: TemperatureUnit | list[TemperatureUnit],
+) -> float | list[float]:
     """Convert temperature between Celsius and Fahrenheit.
     
     Args:
-        value: The numeric value to convert
-        from_unit: The source unit (celsius or fahrenheit)
-        to_unit: The target unit (celsius or fahrenheit)
+        value: The numeric value to convert, or a list of values to convert in one call
+        from_unit: The source unit (celsius or fahrenheit), or one source unit per value
+        to_unit: The target unit (celsius or fahrenheit), or one target unit per value
         
     Returns:
-        The converted temperature value
+        The converted temperature value, or a list of converted values in input order
     """
-    if from_unit == TemperatureUnit.CELSIUS and to_unit == TemperatureUnit.FAHRENHEIT:
-        return (value * 9/5) + 32
-    elif from_unit == TemperatureUnit.FAHRENHEIT and to_unit == TemperatureUnit.CELSIUS:
-        return (value - 32) * 5/9
-    else:
-        raise ValueError(f"Unsupported temperature conversion from {from_unit} to {to_unit}")
+    return convert_linear(value, from_unit, to_unit, TEMPERATURE_FACTORS, "temperature")
+
+
+# A tool doing genuinely heavy computation sets metadata={"cpu_bound": True} to run in
+# the isolated process pool. The unit conversions take microseconds, far less than the
+# round trip to a worker, so none is marked and every tool runs on the tool threads.
 
 
 # Available tools list
@@ -85,5 +148,7 @@ available_tools = [
     convert_weight,
     convert_temperature,
     convert_currency,
-    get_supported_currencies
+    convert_currency_multi,
+    get_supported_currencies,
+    resolve_currency
 ]
@@ -1,9 +1,12 @@
-import requests
 from typing import Dict, Any
 from langchain_core.tools import tool
 import os
 from datetime import datetime
 
+from app.core.currency_catalog import catalog
+from app.core.rates import CurrencyAPIError, rate_cache
+from app.tools.rendering import compact_json, renders, tool_error
+
 
 @tool
 def convert_currency(amount: float, from_currency: str, to_currency: str) -> str:
@@ -11,52 +14,59 @@ def convert_currency(amount: float, from_currency: str, to_currency: str) -> str
     
     Args:
         amount: The amount to convert
-        from_currency: Source currency code (e.g., 'USD', 'EUR', 'GBP')
-        to_currency: Target currency code (e.g., 'USD', 'EUR', 'GBP')
+        from_currency: Source currency code, name or symbol (e.g., 'USD', 'euro', '¥')
+        to_currency: Target currency code, name or symbol (e.g., 'USD', 'euro', '¥')
         
     Returns:
-        Formatted conversion result with exchange rate and timestamp
+        JSON with the amount, currencies, exchange rate, converted amount and rate timestamp
     """
     try:
         # Get API key from environment
         api_key = os.getenv("FREECURRENCY_API_KEY")
         if not api_key:
-            return """❌ **Error**: Currency conversion API key not found. 
-
-Please set the FREECURRENCY_API_KEY environment variable with your API key from https://freecurrencyapi.com/"""
-        
-        # Validate currency codes (should be 3-letter codes)
-        from_currency = from_currency.upper().strip()
-        to_currency = to_currency.upper().strip()
-        
-        if len(from_currency) != 3 or len(to_currency) != 3:
-            return f"❌ **Error**: Invalid currency codes. Please use 3-letter currency codes (e.g., USD, EUR, GBP)"
+            return tool_error(
+                "Currency conversion API key not found. Please set the FREECURRENCY_API_KEY "
+                "environment variable with your API key from https://freecurrencyapi.com/"
+            )
+        
+        # Resolve and validate currency codes locally before any network call
+        from_code = catalog.resolve(from_currency)
+        to_code = catalog.resolve(to_currency)
+        unknown = [text for text, code in ((from_currency, from_code), (to_currency, to_code)) if code is None]
+        if unknown:
+            return tool_error(f"Unsupported currency: {', '.join(unknown)}. Use `resolve_currency` or a 3-letter code (e.g., USD, EUR, GBP)")
+        from_currency, to_currency = from_code, to_code
         
         # Validate amount
         if amount <= 0:
-            return f"❌ **Error**: Amount must be greater than 0"
-        
-        # Make API request to get latest exchange rates
-        api_url = f"https://api.freecurrencyapi.com/v1/latest?apikey={api_key}&base_currency={from_currency}&currencies={to_currency}"
-        
-        response = requests.get(api_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        # Check if the API returned an error
-        if 'error' in data:
-            return f"❌ **Error**: {data['error'].get('message', 'Unknown API error')}"
-        
-        # Extract exchange rate
-        if 'data' not in data or to_currency not in data['data']:
-            return f"❌ **Error**: Exchange rate not found for {from_currency} to {to_currency}"
-        
-        exchange_rate = data['data'][to_currency]
-        converted_amount = amount * exchange_rate
-        
-        # Format the result
-        return f"""**💱 Currency Conversion Result**
+            return tool_error("Amount must be greater than 0")
+        
+        # Served from the rate cache, which the refresh scheduler keeps warm for hot bases
+        snapshot = rate_cache.get(from_currency)
+        if to_currency not in snapshot.rates:
+            return tool_error(f"Exchange rate not found for {from_currency} to {to_currency}")
+        
+        exchange_rate = snapshot.rates[to_currency]
+        return compact_json({
+            "amount": amount,
+            "from": from_currency,
+            "to": to_currency,
+            "rate": exchange_rate,
+            "converted": round(amount * exchange_rate, 2),
+            "rate_time": _rate_time(snapshot.fetched_at),
+        })
+        
+    except CurrencyAPIError as e:
+        return tool_error(str(e))
+    except Exception as e:
+        return tool_error(f"Currency conversion failed: {str(e)}")
+
+
+@renders("convert_currency")
+def render_conversion(args: dict, result: dict) -> str:
+    amount, from_currency, to_currency = result["amount"], result["from"], result["to"]
+    exchange_rate, converted_amount = result["rate"], result["converted"]
+    return f"""**💱 Currency Conversion Result**
 
 **Original Amount**: {amount:,.2f} {from_currency}
 **Converted Amount**: {converted_amount:,.2f} {to_currency}
@@ -64,72 +74,109 @@ Please set the FREECURRENCY_API_KEY environment variable with your API key from
 
 **Calculation**: {amount:,.2f} × {exchange_rate:.6f} = {converted_amount:,.2f}
 
-🕐 **Rate Updated**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (Real-time)
+🕐 **Rate Updated**: {_display_time(result["rate_time"])}
 🔗 **Source**: [FreeCurrencyAPI](https://freecurrencyapi.com/)
 
-*Note: Exchange rates are updated in real-time and may fluctuate throughout the day.*"""
-        
-    except requests.RequestException as e:
-        return f"❌ **Error**: Unable to fetch exchange rates due to network error: {str(e)}"
-    except KeyError as e:
-        return f"❌ **Error**: Invalid response format from currency API: {str(e)}"
+*Note: Exchange rates are refreshed every few minutes and may fluctuate throughout the day.*"""
+
+
+@tool
+def convert_currency_multi(amounts: list[float], from_currencies: list[str], to_currencies: list[str]) -> str:
+    """Convert several amounts into several currencies at once with a single rate lookup.
+
+    Use this instead of repeated convert_currency calls for one amount into many
+    currencies (e.g., 100 USD in EUR, GBP and JPY) or many amounts into one
+    currency (e.g., 10 EUR + 2000 JPY in USD).
+
+    Args:
+        amounts: The amounts to convert (e.g., [100] or [10, 2000])
+        from_currencies: Source currency of each amount, or a single currency for all of them
+        to_currencies: Target currencies, one table column each (e.g., ['EUR', 'GBP', 'JPY'])
+
+    Returns:
+        JSON with one row per amount holding its converted value in every target currency
+    """
+    try:
+        if not amounts or not to_currencies:
+            return tool_error("At least one amount and one target currency are required")
+        if len(from_currencies) == 1:
+            from_currencies = from_currencies * len(amounts)
+        if len(from_currencies) != len(amounts):
+            return tool_error("Give one source currency per amount, or a single source currency for all")
+        if any(amount <= 0 for amount in amounts):
+            return tool_error("Amounts must be greater than 0")
+
+        # Resolve and validate currency codes locally before any network call
+        texts = list(dict.fromkeys(list(from_currencies) + list(to_currencies)))
+        codes = {text: catalog.resolve(text) for text in texts}
+        unknown = [text for text, code in codes.items() if code is None]
+        if unknown:
+            return tool_error(f"Unsupported currency: {', '.join(unknown)}. Use `resolve_currency` or a 3-letter code (e.g., USD, EUR, GBP)")
+        sources = [codes[text] for text in from_currencies]
+        targets = list(dict.fromkeys(codes[text] for text in to_currencies))
+
+        # One base table yields every cross rate, so a single fetch covers all pairs;
+        # a lone source currency is used as the base so its rates need no division
+        base = sources[0] if len(set(sources)) == 1 else targets[0]
+        snapshot = rate_cache.get(base)
+        missing = [code for code in dict.fromkeys(sources + targets) if code not in snapshot.rates]
+        if missing:
+            return tool_error(f"Exchange rate not found for {', '.join(missing)} from {base}")
+
+        rows = [
+            {
+                "amount": amount,
+                "from": source,
+                "converted": [round(amount * snapshot.rates[target] / snapshot.rates[source], 2) for target in targets],
+            }
+            for amount, source in zip(amounts, sources)
+        ]
+        result = {"to": targets, "rows": rows, "base": base, "rate_time": _rate_time(snapshot.fetched_at)}
+        if len(rows) > 1 and len(targets) == 1:
+            result["total"] = round(sum(row["converted"][0] for row in rows), 2)
+        return compact_json(result)
+
+    except CurrencyAPIError as e:
+        return tool_error(str(e))
     except Exception as e:
-        return f"❌ **Error**: Currency conversion failed: {str(e)}"
+        return tool_error(f"Currency conversion failed: {str(e)}")
+
+
+@renders("convert_currency_multi")
+def render_conversion_table(args: dict, result: dict) -> str:
+    targets = result["to"]
+    rows = [
+        f"| {row['amount']:,.2f} {row['from']} | " + " | ".join(f"{value:,.2f}" for value in row["converted"]) + " |"
+        for row in result["rows"]
+    ]
+    if "total" in result:
+        rows.append(f"| **Total** | **{result['total']:,.2f}** |")
+
+    return f"""**💱 Currency Conversion Table**
+
+| Amount | {' | '.join(targets)} |
+|---|{'---|' * len(targets)}
+{chr(10).join(rows)}
+
+🕐 **Rates Updated**: {_display_time(result["rate_time"])} (base {result["base"]})
+🔗 **Source**: [FreeCurrencyAPI](https://freecurrencyapi.com/)"""
 
 
 @tool
 def get_supported_currencies() -> str:
-    """Get a list of supported currency codes for conversion.
+    """Get the list of supported currency codes for conversion.
     
     Returns:
-        List of commonly supported currency codes with their descriptions
+        JSON mapping each supported currency code to its name
     """
-    try:
-        # Get API key from environment
-        api_key = os.getenv("FREECURRENCY_API_KEY")
-        if not api_key:
-            return """❌ **Error**: Currency conversion API key not found. 
+    return compact_json(catalog.currencies)
 
-Please set the FREECURRENCY_API_KEY environment variable with your API key from https://freecurrencyapi.com/"""
-        
-        # Make API request to get supported currencies
-        api_url = f"https://api.freecurrencyapi.com/v1/currencies?apikey={api_key}"
-        
-        response = requests.get(api_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if 'data' not in data:
-            # Fallback to common currencies if API doesn't provide the list
-            common_currencies = {
-                'USD': 'US Dollar',
-                'EUR': 'Euro',
-                'GBP': 'British Pound',
-                'JPY': 'Japanese Yen',
-                'AUD': 'Australian Dollar',
-                'CAD': 'Canadian Dollar',
-                'CHF': 'Swiss Franc',
-                'CNY': 'Chinese Yuan',
-                'INR': 'Indian Rupee',
-                'KRW': 'South Korean Won',
-                'MXN': 'Mexican Peso',
-                'BRL': 'Brazilian Real',
-                'RUB': 'Russian Ruble',
-                'ZAR': 'South African Rand',
-                'SGD': 'Singapore Dollar',
-                'HKD': 'Hong Kong Dollar',
-                'NOK': 'Norwegian Krone',
-                'SEK': 'Swedish Krona',
-                'DKK': 'Danish Krone',
-                'PLN': 'Polish Zloty'
-            }
-            
-            formatted_currencies = []
-            for code, name in common_currencies.items():
-                formatted_currencies.append(f"• **{code}**: {name}")
-            
-            return f"""**💱 Commonly Supported Currency Codes**
+
+@renders("get_supported_currencies")
+def render_supported_currencies(args: dict, currencies: dict) -> str:
+    formatted_currencies = [f"• **{code}**: {name}" for code, name in currencies.items()]
+
+    return f"""**💱 Supported Currency Codes** ({len(currencies)} currencies)
 
 {chr(10).join(formatted_currencies)}
 
@@ -138,34 +185,32 @@ Please set the FREECURRENCY_API_KEY environment variable with your API key from
 - `convert_currency(50, "GBP", "JPY")` - Convert 50 GBP to JPY
 
 🔗 **Source**: [FreeCurrencyAPI](https://freecurrencyapi.com/)"""
+
+
+@tool
+def resolve_currency(queries: list[str]) -> str:
+    """Resolve currency names, plurals or symbols to ISO codes without any network call.
+    
+    Args:
+        queries: Free-text currencies to resolve (e.g., ['yen', 'rupees', '€', 'usd'])
         
-        # Process API response
-        currencies = data['data']
-        formatted_currencies = []
-        
-        # Sort currencies by code for better readability
-        sorted_currencies = sorted(currencies.items())
-        
-        for code, info in sorted_currencies[:30]:  # Limit to first 30 for readability
-            name = info.get('name', 'Unknown')
-            formatted_currencies.append(f"• **{code}**: {name}")
-        
-        total_count = len(currencies)
-        showing_count = min(30, total_count)
-        
-        return f"""**💱 Supported Currency Codes** (Showing {showing_count} of {total_count})
+    Returns:
+        One line per query with the resolved ISO code and currency name
+    """
+    currencies = catalog.currencies
+    lines = []
+    for query in queries:
+        code = catalog.resolve(query)
+        if code is None:
+            lines.append(f"{query} -> unknown")
+        else:
+            lines.append(f"{query} -> {code} ({currencies[code]})")
+    return "\n".join(lines)
 
-{chr(10).join(formatted_currencies)}
 
-**Usage Example**: 
-- `convert_currency(100, "USD", "EUR")` - Convert 100 USD to EUR
-- `convert_currency(50, "GBP", "JPY")` - Convert 50 GBP to JPY
+def _rate_time(fetched_at: float) -> str:
+    return datetime.fromtimestamp(fetched_at).isoformat(timespec="seconds")
 
-🔗 **Source**: [FreeCurrencyAPI](https://freecurrencyapi.com/)
 
-*Note: This is a partial list. The API supports {total_count} currencies in total.*"""
-        
-    except requests.RequestException as e:
-        return f"❌ **Error**: Unable to fetch supported currencies due to network error: {str(e)}"
-    except Exception as e:
-        return f"❌ **Error**: Failed to get supported currencies: {str(e)}"
+def _display_time(rate_time: str) -> str:
+    return datetime.fromisoformat(rate_time).strftime('%Y-%m-%d %H:%M:%S')
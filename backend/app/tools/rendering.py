@@ -0,0 +1,46 @@
+import json
+from typing import Any, Callable
+
+# Tool name -> function turning (tool args, decoded compact result) into markdown for the UI
+ToolRenderer = Callable[[dict, Any], str]
+
+_renderers: dict[str, ToolRenderer] = {}
+
+
+def compact_json(data: Any) -> str:
+    """Serialize a tool result as the minimal JSON the model reads back on every turn."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def tool_error(message: str) -> str:
+    """Compact result for a tool call that failed with message."""
+    return compact_json({"error": message})
+
+
+def renders(tool_name: str) -> Callable[[ToolRenderer], ToolRenderer]:
+    """Register the decorated function as the markdown renderer for tool_name."""
+    def register(renderer: ToolRenderer) -> ToolRenderer:
+        _renderers[tool_name] = renderer
+        return renderer
+    return register
+
+
+def render_tool_result(tool_name: str, args: dict, result: str) -> str:
+    """Return the markdown shown to the user for a tool result.
+
+    Tools without a renderer, and results that are not the tool's compact
+    JSON (such as agent-side execution errors), are shown unchanged.
+    """
+    renderer = _renderers.get(tool_name)
+    if renderer is None:
+        return result
+    try:
+        data = json.loads(result)
+    except ValueError:
+        return result
+    if isinstance(data, dict) and "error" in data:
+        return f"❌ **Error**: {data['error']}"
+    try:
+        return renderer(args, data)
+    except (KeyError, TypeError, ValueError):
+        return result
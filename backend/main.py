@@ -1,8 +1,27 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.routes import router
 from app.core.config import HOST, PORT
+from app.core.process_pool import tool_process_pool
+from app.core.rates import rate_refresh_scheduler
+from app.tools.conversion_tools import available_tools
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background resources with the application."""
+    # Warm the CPU-bound tool workers before the first request needs them, if any tool uses them
+    if any((tool.metadata or {}).get("cpu_bound") for tool in available_tools):
+        await run_in_threadpool(tool_process_pool.start)
+    # Keep the most requested exchange rates warm ahead of their expiry
+    rate_refresh_scheduler.start()
+    yield
+    await rate_refresh_scheduler.stop()
+    tool_process_pool.shutdown()
 
 
 def create_app() -> FastAPI:
@@ -10,7 +29,8 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="AI Agent Conversion Service",
         description="A FastAPI service for unit conversions using AI agents",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     # Add CORS middleware
@@ -20,6 +40,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Retry-After"],
     )
     
     # Include API routes
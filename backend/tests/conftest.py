@@ -0,0 +1,56 @@
+import time
+from typing import Iterator
+
+import pytest
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+import app.core.agent as agent_module
+
+
+class FakeChatModel:
+    """Chat model stand-in that streams a scripted list of chunks per call.
+
+    A chunk may also be an exception, raised at that point of the stream, or
+    a number of seconds to stall for.
+    """
+
+    def __init__(self, turns: list[list[AIMessageChunk | Exception | float]]):
+        self.turns = list(turns)
+        self.calls: list[list[BaseMessage]] = []
+
+    def bind_tools(self, tools) -> "FakeChatModel":
+        return self
+
+    def stream(self, messages: list[BaseMessage]) -> Iterator[AIMessageChunk]:
+        self.calls.append(list(messages))
+        for chunk in self.turns.pop(0):
+            if isinstance(chunk, Exception):
+                raise chunk
+            if isinstance(chunk, (int, float)):
+                time.sleep(chunk)
+                continue
+            yield chunk
+
+
+@pytest.fixture
+def app_client(monkeypatch):
+    """TestClient for the API routes, with a model that must not be called."""
+    monkeypatch.setattr(agent_module, "init_chat_model", lambda *args, **kwargs: FakeChatModel([]))
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.routes import router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1")
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_agent(monkeypatch):
+    """Build an AIAgent whose model streams the given turns."""
+    def make(turns: list[list[AIMessageChunk | Exception | float]]) -> tuple[agent_module.AIAgent, FakeChatModel]:
+        model = FakeChatModel(turns)
+        monkeypatch.setattr(agent_module, "init_chat_model", lambda *args, **kwargs: model)
+        return agent_module.AIAgent(), model
+    return make
@@ -0,0 +1,27 @@
+"""Tools served by the process pool workers in test_process_pool."""
+import time
+
+from langchain_core.tools import tool
+
+
+@tool
+def double(value: float) -> float:
+    """Double value."""
+    return value * 2
+
+
+@tool
+def nap(seconds: float) -> str:
+    """Sleep for seconds."""
+    time.sleep(seconds)
+    return "rested"
+
+
+@tool
+def spin() -> str:
+    """Burn CPU until killed."""
+    while True:
+        pass
+
+
+available_tools = [double, nap, spin]
@@ -0,0 +1,176 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from app.core.deadline import Deadline
+from app.core.metrics import metrics
+from app.core.models import AgentStats, DeadlineReached, ToolExecution
+from app.core.usage import prompt_breakdown
+
+
+def tool_call_chunk(args: str, name=None, id=None) -> AIMessageChunk:
+    return AIMessageChunk(content="", tool_call_chunks=[{"name": name, "args": args, "id": id, "index": 0}])
+
+
+def test_fragmented_tool_call_runs_with_final_args(make_agent):
+    agent, model = make_agent([
+        [
+            tool_call_chunk("", name="convert_distance", id="call-1"),
+            tool_call_chunk('{"value": 10, '),
+            tool_call_chunk('"from_unit": "km", "to_unit": "miles"}'),
+        ],
+        [AIMessageChunk(content="10 km is 6.21 miles.")],
+    ])
+
+    items = list(agent.ask("convert 10 km to miles"))
+
+    executions = [item for item in items if isinstance(item, ToolExecution)]
+    assert len(executions) == 1
+    assert executions[0].args == {"value": 10, "from_unit": "km", "to_unit": "miles"}
+    assert executions[0].result == "6.21371"
+    # The model's tool call is recorded with the complete arguments too
+    assert model.calls[1][-2].tool_calls[0]["args"] == {"value": 10, "from_unit": "km", "to_unit": "miles"}
+
+
+def test_tool_call_without_args_runs_at_end_of_stream(make_agent):
+    agent, _ = make_agent([
+        [tool_call_chunk("", name="get_supported_currencies", id="call-1")],
+        [AIMessageChunk(content="Here they are.")],
+    ])
+
+    executions = [item for item in agent.ask("which currencies?") if isinstance(item, ToolExecution)]
+
+    assert len(executions) == 1
+    assert executions[0].args == {}
+    assert '"USD"' in executions[0].result
+
+
+def test_failed_attempt_usage_is_recorded(make_agent, monkeypatch):
+    monkeypatch.setattr("app.core.agent.time.sleep", lambda seconds: None)
+    agent, _ = make_agent([
+        [AIMessageChunk(content="partial "), ConnectionError("stream dropped")],
+        [AIMessageChunk(content="done")],
+    ])
+
+    stats = list(agent.ask("hello"))[-1]
+
+    assert isinstance(stats, AgentStats)
+    assert stats.usage.model_calls == 2
+    assert stats.usage.estimated_calls == 2
+    assert stats.usage.input_tokens > 0
+
+
+def test_deadline_aborted_call_usage_is_recorded(make_agent):
+    agent, _ = make_agent([[AIMessageChunk(content="partial "), 2.0, AIMessageChunk(content="too late")]])
+
+    items = list(agent.ask("hello", deadline=Deadline(0.3)))
+
+    assert isinstance(items[-2], DeadlineReached)
+    assert items[-1].usage.model_calls == 1
+    assert items[-1].usage.input_tokens > 0
+    assert items[-1].usage.output_tokens > 0
+
+
+def test_wasted_tokens_include_failed_prompt(make_agent, monkeypatch):
+    monkeypatch.setattr("app.core.agent.time.sleep", lambda seconds: None)
+    agent, model = make_agent([[ConnectionError("stream dropped")], [AIMessageChunk(content="done")]])
+    before = metrics.snapshot()["counters"].get("model_stream_wasted_tokens", 0)
+
+    list(agent.ask("hello"))
+
+    wasted = metrics.snapshot()["counters"]["model_stream_wasted_tokens"] - before
+    breakdown = prompt_breakdown(model.calls[0])
+    assert wasted == breakdown.system_tokens + breakdown.history_tokens + breakdown.tool_result_tokens
+    assert wasted > 0
+
+
+def test_failed_tool_result_is_not_memoized(make_agent):
+    bad_call = '{"value": 10, "from_unit": "km", "to_unit": "km"}'
+    agent, _ = make_agent([
+        [tool_call_chunk(bad_call, name="convert_distance", id="call-1")],
+        [tool_call_chunk(bad_call, name="convert_distance", id="call-2")],
+        [AIMessageChunk(content="That conversion is not supported.")],
+    ])
+
+    items = list(agent.ask("convert 10 km to km"))
+
+    executions = [item for item in items if isinstance(item, ToolExecution)]
+    assert [execution.result.startswith("Error executing tool") for execution in executions] == [True, True]
+    assert items[-1].tool_calls == 2
+    assert items[-1].tool_calls_saved == 0
+
+
+def test_sessions_do_not_share_history(make_agent):
+    agent, model = make_agent([
+        [AIMessageChunk(content="First answer.")],
+        [AIMessageChunk(content="Second answer.")],
+    ])
+
+    list(agent.ask("first user's question"))
+    list(agent.ask("second user's question"))
+
+    second_prompt = [message.content for message in model.calls[1]]
+    assert "second user's question" in second_prompt
+    assert "first user's question" not in second_prompt
+    assert "First answer." not in second_prompt
+
+
+def test_queued_tool_calls_are_cancelled_when_request_ends(make_agent, monkeypatch):
+    monkeypatch.setattr("app.core.agent.TOOL_WORKERS", 1)
+    agent, _ = make_agent([[
+        AIMessageChunk(content="", tool_call_chunks=[
+            {"name": "convert_distance", "args": '{"value": 1, "from_unit": "km", "to_unit": "miles"}', "id": "a", "index": 0},
+            {"name": "convert_distance", "args": '{"value": 2, "from_unit": "km", "to_unit": "miles"}', "id": "b", "index": 1},
+        ]),
+    ]])
+    invoked = []
+
+    class SlowTool:
+        metadata = None
+
+        def invoke(self, args):
+            invoked.append(args)
+            time.sleep(0.5)
+            return "1.0"
+
+    agent.tool_mapping["convert_distance"] = SlowTool()
+
+    items = list(agent.ask("convert", deadline=Deadline(0.2)))
+    time.sleep(0.8)
+
+    assert isinstance(items[-2], DeadlineReached)
+    # The second call was still queued behind the first when the deadline passed
+    assert len(invoked) == 1
+
+
+def test_stats_reported_when_all_retries_fail(make_agent, monkeypatch):
+    monkeypatch.setattr("app.core.agent.time.sleep", lambda seconds: None)
+    monkeypatch.setattr("app.core.agent.STREAM_MAX_RETRIES", 1)
+    agent, _ = make_agent([[ConnectionError("down")], [ConnectionError("still down")]])
+
+    items = []
+    with pytest.raises(ConnectionError):
+        for item in agent.ask("hello"):
+            items.append(item)
+
+    assert isinstance(items[-1], AgentStats)
+    assert items[-1].usage.model_calls == 2
+    assert items[-1].usage.input_tokens > 0
+
+
+def test_follow_up_in_same_conversation_sees_earlier_turns(make_agent):
+    agent, model = make_agent([
+        [AIMessageChunk(content="100 USD is 92 EUR.")],
+        [AIMessageChunk(content="And 79 GBP.")],
+        [AIMessageChunk(content="Which amount?")],
+    ])
+
+    list(agent.ask("100 USD in EUR?", client_id="alice", conversation_id="chat-1"))
+    list(agent.ask("and in GBP?", client_id="alice", conversation_id="chat-1"))
+    list(agent.ask("and in JPY?", client_id="mallory", conversation_id="chat-1"))
+
+    follow_up = [message.content for message in model.calls[1]]
+    assert follow_up[1:] == ["100 USD in EUR?", "100 USD is 92 EUR.", "and in GBP?"]
+    # The same conversation id from another client is a different conversation
+    assert [message.content for message in model.calls[2]][1:] == ["and in JPY?"]
@@ -0,0 +1,75 @@
+import pytest
+
+from app.core.bulk import BULK_ERROR_MARKER, RecordBatcher
+from app.core.rates import RateSnapshot, rate_cache
+
+
+@pytest.fixture
+def client(app_client, monkeypatch):
+    snapshot = RateSnapshot("EUR", {"EUR": 1.0, "USD": 1.1, "GBP": 0.85}, fetched_at=0.0, expires_at=float("inf"))
+    monkeypatch.setattr(rate_cache, "get", lambda base: snapshot)
+    return app_client
+
+
+def test_converts_csv(client):
+    response = client.post("/api/v1/convert/csv?to=EUR", content="id,amount,currency\n1,11,USD\n2,x,GBP\n")
+
+    assert response.status_code == 200
+    assert response.text == "id,amount,currency,amount_EUR\n1,11,USD,10.00\n2,x,GBP,\n"
+
+
+def test_missing_columns_rejected_before_streaming(client):
+    response = client.post("/api/v1/convert/csv?to=EUR", content="id,value,code\n1,11,USD\n")
+
+    assert response.status_code == 400
+    assert "must contain 'amount' and 'currency'" in response.json()["detail"]
+
+
+def test_empty_body_rejected(client):
+    response = client.post("/api/v1/convert/csv?to=EUR", content="")
+
+    assert response.status_code == 400
+
+
+def test_unknown_target_currency_rejected_without_fetching(app_client, monkeypatch):
+    def fail(base):
+        raise AssertionError("rates must not be fetched for an unknown currency")
+    monkeypatch.setattr(rate_cache, "get", fail)
+
+    response = app_client.post("/api/v1/convert/csv?to=dogecoin", content="amount,currency\n1,USD\n")
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unsupported currency: dogecoin"
+
+
+def test_target_currency_name_is_resolved(client):
+    response = client.post("/api/v1/convert/csv?to=euro", content="amount,currency\n11,USD\n")
+
+    assert response.status_code == 200
+    assert response.text == "amount,currency,amount_EUR\n11,USD,10.00\n"
+
+
+def test_stray_quote_in_unquoted_field_does_not_swallow_later_rows(client):
+    body = 'id,item,amount,currency\n1,12" pipe,11,USD\n2,"a ""b""\nc",22,USD\n3,x,33,USD\n'
+
+    response = client.post("/api/v1/convert/csv?to=EUR", content=body)
+
+    assert response.status_code == 200
+    assert response.text.splitlines()[1:] == ['1,"12"" pipe",11,USD,10.00', '2,"a ""b""', 'c",22,USD,20.00', "3,x,33,USD,30.00"]
+
+
+def test_record_batcher_rejects_overlong_record():
+    batcher = RecordBatcher(batch_size=10, max_record_size=20)
+    batcher.feed('1,"unterminated\n')
+
+    with pytest.raises(ValueError, match="longer than 20 characters"):
+        batcher.feed("more text on the next line\n")
+
+
+def test_malformed_file_ends_with_error_line(client):
+    body = 'amount,currency\n11,USD\n1,"unterminated\n' + "2,USD\n" * 200_000
+
+    response = client.post("/api/v1/convert/csv?to=EUR", content=body)
+
+    assert response.status_code == 200
+    assert response.text.splitlines()[-1].startswith(f"{BULK_ERROR_MARKER} CSV record longer than")
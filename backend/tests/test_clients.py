@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from app.core import clients
+from app.core.clients import ANONYMOUS_CLIENT, ClientRegistry, FairScheduler, TokenBucket, UnknownClientError
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.core.models import TokenUsage
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen monotonic clock for the token buckets, advanced by assigning now."""
+    class Clock:
+        now = 1000.0
+
+    monkeypatch.setattr(clients.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def serve_in_order(scheduler: FairScheduler, requests: list[tuple[str, float]]) -> list[str]:
+    """Queue requests of (client, weight) behind a held slot and return the order they are served in."""
+    served = []
+    holder = scheduler.slot("holder")
+    holder.__enter__()
+
+    threads = []
+    for client_id, weight in requests:
+        def call(client_id=client_id, weight=weight):
+            with scheduler.slot(client_id, weight):
+                served.append(client_id)
+        thread = threading.Thread(target=call)
+        thread.start()
+        # Enqueue one at a time so ties are broken by arrival, as in production
+        while len(scheduler._waiting) < len(threads) + 1:
+            time.sleep(0.001)
+        threads.append(thread)
+
+    holder.__exit__(None, None, None)
+    for thread in threads:
+        thread.join(5)
+    return served
+
+
+def test_bursting_client_queues_behind_itself():
+    served = serve_in_order(FairScheduler(slots=1), [("a", 1), ("a", 1), ("a", 1), ("b", 1)])
+
+    assert served == ["a", "b", "a", "a"]
+
+
+def test_weight_scales_share_of_slots():
+    requests = [("heavy", 2)] * 3 + [("light", 1)] * 3
+
+    served = serve_in_order(FairScheduler(slots=1), requests)
+
+    assert served == ["heavy", "light", "heavy", "heavy", "light", "light"]
+
+
+def test_expired_deadline_removes_queued_ticket():
+    scheduler = FairScheduler(slots=1)
+    holder = scheduler.slot("a")
+    holder.__enter__()
+
+    with pytest.raises(DeadlineExceeded):
+        with scheduler.slot("b", deadline=Deadline(0.05)):
+            pass
+
+    assert scheduler._waiting == []
+    holder.__exit__(None, None, None)
+    with scheduler.slot("c") as waited:
+        assert waited < 1
+
+
+def test_token_bucket_debt_is_repaid_by_refill(clock):
+    bucket = TokenBucket(rate=10, capacity=100)
+
+    bucket.charge(150)
+
+    assert not bucket.try_take()
+    assert bucket.wait_time() == pytest.approx(5.1)
+    clock.now += 6
+    assert bucket.try_take()
+
+
+def test_client_in_token_debt_is_throttled(clock):
+    registry = ClientRegistry(api_keys="")
+    assert registry.admit("c") is None
+
+    registry.charge_tokens("c", TokenUsage(input_tokens=int(clients.CLIENT_TOKEN_BURST) + 600))
+
+    retry_after = registry.admit("c")
+    assert retry_after == pytest.approx(601 / (clients.CLIENT_TOKENS_PER_MINUTE / 60))
+    assert registry.snapshot()["c"]["requests_throttled_by_tokens"] == 1
+
+
+def test_request_burst_scales_with_weight(clock):
+    registry = ClientRegistry(api_keys="key-1:heavy:2")
+    burst = int(clients.CLIENT_REQUEST_BURST)
+
+    light = [registry.admit("light") for _ in range(burst + 1)]
+    heavy = [registry.admit("heavy") for _ in range(2 * burst + 1)]
+
+    assert light[:-1] == [None] * burst and light[-1] is not None
+    assert heavy[:-1] == [None] * 2 * burst and heavy[-1] is not None
+
+
+def test_identify_keyed_and_header_clients():
+    registry = ClientRegistry(api_keys="key-1:alpha:2")
+
+    assert registry.identify("key-1", None) == "alpha"
+    assert registry.identify("key-1", "spoofed") == "alpha"
+    assert registry.identify(None, " browser-7 ") == "browser-7"
+    assert registry.identify(None, None) == ANONYMOUS_CLIENT
+    assert len(registry.identify(None, "x" * 500)) == clients.MAX_CLIENT_ID_LENGTH
+    with pytest.raises(UnknownClientError):
+        registry.identify("wrong-key", None)
+    # A keyed client cannot be claimed through X-Client-ID alone
+    with pytest.raises(UnknownClientError):
+        registry.identify(None, "alpha")
@@ -0,0 +1,35 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.core.conversations import ConversationStore
+
+
+def test_history_is_trimmed_at_a_user_message():
+    store = ConversationStore(max_messages=3)
+    messages = [
+        HumanMessage(content="10 km in miles?"),
+        AIMessage(content="", tool_calls=[{"name": "convert_distance", "args": {}, "id": "a"}]),
+        ToolMessage(content="6.21", tool_call_id="a"),
+        AIMessage(content="6.21 miles."),
+        HumanMessage(content="and 20?"),
+        AIMessage(content="12.43 miles."),
+    ]
+
+    store.save(("client", "chat"), messages)
+
+    assert store.get(("client", "chat")) == messages[4:]
+
+
+def test_least_recently_saved_conversation_is_evicted():
+    store = ConversationStore(max_conversations=2)
+    for name in ("a", "b", "c"):
+        store.save(("client", name), [HumanMessage(content=name)])
+
+    assert store.get(("client", "a")) == []
+    assert [message.content for message in store.get(("client", "c"))] == ["c"]
+
+
+def test_expired_conversation_is_forgotten():
+    store = ConversationStore(ttl=-1)
+    store.save(("client", "chat"), [HumanMessage(content="hi")])
+
+    assert store.get(("client", "chat")) == []
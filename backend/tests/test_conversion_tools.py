@@ -0,0 +1,40 @@
+import pytest
+
+from app.core.config import KM_TO_MILES
+from app.tools.conversion_tools import DISTANCE_FACTORS, TEMPERATURE_FACTORS, convert_linear, convert_temperature
+
+
+def test_single_value_returns_float():
+    assert convert_linear(10, "km", "miles", DISTANCE_FACTORS, "distance") == pytest.approx(10 * KM_TO_MILES)
+
+
+def test_list_with_one_unit_pair_converts_every_value():
+    result = convert_linear([0, 100], "celsius", "fahrenheit", TEMPERATURE_FACTORS, "temperature")
+
+    assert result == pytest.approx([32, 212])
+
+
+def test_mixed_unit_pairs_convert_per_value():
+    result = convert_linear([10, 10, 5], ["km", "miles", "km"], ["miles", "km", "miles"], DISTANCE_FACTORS, "distance")
+
+    assert result == pytest.approx([10 * KM_TO_MILES, 10 / KM_TO_MILES, 5 * KM_TO_MILES])
+
+
+def test_mixed_temperature_pairs_apply_offsets_per_value():
+    result = convert_temperature.invoke({
+        "value": [100, 212],
+        "from_unit": ["celsius", "fahrenheit"],
+        "to_unit": ["fahrenheit", "celsius"],
+    })
+
+    assert result == pytest.approx([212, 100])
+
+
+def test_unit_list_length_mismatch_is_rejected():
+    with pytest.raises(ValueError, match="Expected 1 or 3 units, got 2"):
+        convert_linear([1, 2, 3], ["km", "miles"], "miles", DISTANCE_FACTORS, "distance")
+
+
+def test_unsupported_pair_names_the_offending_units():
+    with pytest.raises(ValueError, match="Unsupported distance conversion from km to km"):
+        convert_linear([1, 2], ["km", "km"], ["miles", "km"], DISTANCE_FACTORS, "distance")
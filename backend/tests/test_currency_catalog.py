@@ -0,0 +1,52 @@
+import math
+
+import pytest
+
+from app.core import currency_catalog
+from app.core.currency_catalog import CurrencyCatalog
+
+
+@pytest.fixture
+def catalog():
+    # An infinite TTL keeps the catalog from refreshing itself in the background
+    return CurrencyCatalog(ttl=math.inf)
+
+
+@pytest.mark.parametrize("text, code", [
+    ("USD", "USD"),
+    (" eur ", "EUR"),
+    ("Japanese Yen", "JPY"),
+    ("quid", "GBP"),
+    ("euros", "EUR"),
+    ("Rupees", "INR"),
+    ("dollars.", "USD"),
+    ("€", "EUR"),
+    ("£", "GBP"),
+    ("$", "USD"),
+    ("zł", "PLN"),
+])
+def test_resolves_codes_names_plurals_and_symbols(catalog, text, code):
+    assert catalog.resolve(text) == code
+
+
+@pytest.mark.parametrize("text", ["dogecoin", "", "xyz", "s"])
+def test_unknown_text_resolves_to_none(catalog, text):
+    assert catalog.resolve(text) is None
+
+
+def test_refresh_indexes_api_names_plurals_and_symbols(catalog, monkeypatch):
+    monkeypatch.setattr(currency_catalog, "get_api_key", lambda: "key")
+    monkeypatch.setattr(currency_catalog, "get_json", lambda url, params: {"data": {
+        "USD": {"name": "US Dollar", "name_plural": "US dollars", "symbol": "$"},
+        "CAD": {"name": "Canadian Dollar", "name_plural": "Canadian dollars", "symbol": "CA$", "symbol_native": "$"},
+    }})
+
+    catalog.refresh()
+
+    assert catalog.currencies == {"CAD": "Canadian Dollar", "USD": "US Dollar"}
+    assert catalog.resolve("ca$") == "CAD"
+    assert catalog.resolve("canadian dollars") == "CAD"
+    # Curated aliases win over symbols shared by several currencies
+    assert catalog.resolve("$") == "USD"
+    # Currencies the API no longer lists stop resolving
+    assert catalog.resolve("EUR") is None
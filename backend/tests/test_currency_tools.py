@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from app.core.rates import RateSnapshot, rate_cache
+from app.tools.currency_tools import convert_currency_multi
+
+USD_RATES = {"USD": 1.0, "EUR": 0.9, "GBP": 0.8, "JPY": 150.0}
+
+
+@pytest.fixture
+def rate_bases(monkeypatch):
+    """Bases looked up from a stubbed rate cache quoting USD_RATES from any base."""
+    bases = []
+
+    def get(base):
+        bases.append(base)
+        rates = {code: rate / USD_RATES[base] for code, rate in USD_RATES.items()}
+        return RateSnapshot(base, rates, fetched_at=0.0, expires_at=float("inf"))
+
+    monkeypatch.setattr(rate_cache, "get", get)
+    return bases
+
+
+def convert(amounts, from_currencies, to_currencies) -> dict:
+    return json.loads(convert_currency_multi.invoke({
+        "amounts": amounts, "from_currencies": from_currencies, "to_currencies": to_currencies,
+    }))
+
+
+def test_one_amount_into_many_currencies(rate_bases):
+    result = convert([100], ["USD"], ["EUR", "gbp", "¥"])
+
+    assert rate_bases == ["USD"]
+    assert result["to"] == ["EUR", "GBP", "JPY"]
+    assert result["rows"] == [{"amount": 100, "from": "USD", "converted": [90.0, 80.0, 15000.0]}]
+    assert "total" not in result
+
+
+def test_many_amounts_into_one_currency_with_total(rate_bases):
+    result = convert([10, 3000], ["euro", "JPY"], ["USD"])
+
+    # A single rate table serves both cross rates
+    assert rate_bases == ["USD"]
+    assert [row["converted"] for row in result["rows"]] == [[11.11], [20.0]]
+    assert result["total"] == 31.11
+
+
+def test_cross_rates_from_target_base(rate_bases):
+    result = convert([100, 100], ["EUR", "JPY"], ["GBP"])
+
+    assert result["base"] == "GBP"
+    assert [row["converted"][0] for row in result["rows"]] == [88.89, 0.53]
+
+
+def test_source_count_mismatch_is_rejected(rate_bases):
+    result = convert([1, 2, 3], ["USD", "EUR"], ["GBP"])
+
+    assert "one source currency per amount" in result["error"]
+    assert rate_bases == []
+
+
+def test_unknown_currency_rejected_without_lookup(rate_bases):
+    result = convert([1], ["USD"], ["dogecoin"])
+
+    assert result["error"].startswith("Unsupported currency: dogecoin")
+    assert rate_bases == []
@@ -0,0 +1,75 @@
+import multiprocessing
+
+import pytest
+
+from app.core import process_pool
+from app.core.process_pool import ToolProcessError, ToolProcessPool
+
+
+class ExitingContext:
+    """Spawn context whose workers exit before reporting ready."""
+
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+
+    def Pipe(self):
+        return self._context.Pipe()
+
+    def Process(self, target, args, name, daemon):
+        return self._context.Process(target=_exit_immediately, args=args, name=name, daemon=daemon)
+
+
+def _exit_immediately(conn, *args):
+    conn.close()
+
+
+def test_worker_exiting_during_startup_raises_tool_process_error():
+    worker = process_pool._Worker(ExitingContext(), 0, 0)
+
+    with pytest.raises(ToolProcessError):
+        worker.wait_ready(30)
+
+
+def test_pool_falls_back_to_inline_when_workers_fail_to_start():
+    pool = ToolProcessPool(workers=2)
+    pool._context = ExitingContext()
+
+    pool.start()
+
+    assert not pool.enabled
+
+
+@pytest.fixture
+def pool():
+    pool = ToolProcessPool(workers=1, timeout=30, cpu_seconds=1, memory_mb=0, tools_module="tests.pool_tools")
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_run_returns_tool_result(pool):
+    assert pool.run("double", {"value": 21}) == 42
+
+
+def test_run_raises_tool_error(pool):
+    with pytest.raises(ToolProcessError, match="validation error"):
+        pool.run("double", {"value": "not a number"})
+
+    # The worker that reported the error keeps serving calls
+    assert pool.run("double", {"value": 1}) == 2
+
+
+def test_run_kills_and_replaces_worker_on_timeout(pool):
+    with pytest.raises(ToolProcessError, match="timed out"):
+        pool.run("nap", {"seconds": 30}, timeout=0.5)
+
+    # The caller does not wait for the replacement worker to start
+    assert pool._idle.empty()
+    assert pool.run("double", {"value": 2}) == 4
+
+
+def test_run_kills_worker_over_cpu_limit(pool):
+    with pytest.raises(ToolProcessError, match="terminated"):
+        pool.run("spin", {})
+
+    assert pool.run("double", {"value": 3}) == 6
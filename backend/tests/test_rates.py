@@ -0,0 +1,94 @@
+import pytest
+
+from app.core import rates
+from app.core.rates import RateCache, RateRefreshScheduler
+
+
+class Clock:
+    """Stand-in for the time module whose time() is set by the test."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(100_000.0)
+    monkeypatch.setattr(rates, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Bases fetched from the stubbed currency API, in order."""
+    fetched = []
+
+    def fetch_latest_rates(base_currency):
+        fetched.append(base_currency)
+        return {base_currency: 1.0, "EUR": 0.9}
+
+    monkeypatch.setattr(rates, "fetch_latest_rates", fetch_latest_rates)
+    return fetched
+
+
+def test_hot_base_is_refreshed_ahead_of_expiry(clock, fetches):
+    cache = RateCache(ttl=900, half_life=3600)
+    scheduler = RateRefreshScheduler(cache, quota_per_hour=60, quota_share=0.5, lead=30, max_bases=4)
+    cache.get("USD")
+
+    clock.now += 869
+    scheduler.tick()
+    assert fetches == ["USD"]
+
+    clock.now += 1
+    scheduler.tick()
+    assert fetches == ["USD", "USD"]
+
+    # Requests after the original expiry are served from the refreshed rates
+    clock.now += 60
+    cache.get("USD")
+    assert fetches == ["USD", "USD"]
+
+
+def test_refreshes_stop_when_budget_share_is_used(clock, fetches):
+    # A long half-life keeps the bases hot for the whole test
+    cache = RateCache(ttl=60, half_life=10 * 3600)
+    scheduler = RateRefreshScheduler(cache, quota_per_hour=10, quota_share=0.2, lead=10, max_bases=4)
+    for base in ("USD", "GBP", "JPY"):
+        cache.get(base)
+
+    clock.now += 50
+    delay = scheduler.tick()
+    assert len(fetches) == 3 + 2
+
+    clock.now += delay
+    scheduler.tick()
+    assert len(fetches) == 3 + 2
+
+    # The budget frees up once the first refreshes leave the hourly window
+    clock.now += 3600
+    scheduler.tick()
+    assert len(fetches) > 3 + 2
+
+
+def test_interval_stretches_with_more_hot_bases():
+    scheduler = RateRefreshScheduler(RateCache(ttl=900), quota_per_hour=60, quota_share=0.5, lead=30)
+
+    assert scheduler.refresh_interval(1) == 870
+    # 10 bases at a 30 per hour budget need 20 minutes between refreshes of each
+    assert scheduler.refresh_interval(10) == 1200
+
+
+def test_hot_bases_ranked_by_decayed_request_count(clock, fetches):
+    cache = RateCache(ttl=900, half_life=600)
+    cache.get("GBP")
+    clock.now += 1200
+    for base in ("USD", "USD", "EUR"):
+        cache.get(base)
+
+    # GBP's single request has decayed to a quarter, below the hot threshold
+    assert cache.hot_bases(limit=5) == ["USD", "EUR"]
+    assert cache.hot_bases(limit=1) == ["USD"]
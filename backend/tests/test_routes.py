@@ -0,0 +1,51 @@
+import json
+import threading
+
+
+def test_new_session_rejected_when_all_slots_busy(app_client, monkeypatch):
+    from app.api import routes
+    from app.core.clients import client_registry
+
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(routes, "session_slots", slots)
+
+    response = app_client.get("/api/v1/convert", params={"query": "10 km in miles"}, headers={"X-Client-ID": "busy-test"})
+
+    assert response.status_code == 503
+    # Refused sessions are not charged to the client's quota
+    assert "busy-test" not in client_registry.snapshot()
+
+
+def test_failed_session_reports_its_usage(app_client, monkeypatch):
+    from app.api import routes
+    from app.core.deadline import Deadline
+    from tests.conftest import FakeChatModel
+
+    monkeypatch.setattr("app.core.agent.time.sleep", lambda seconds: None)
+    monkeypatch.setattr("app.core.agent.STREAM_MAX_RETRIES", 0)
+    monkeypatch.setattr(routes.agent, "model_with_tools", FakeChatModel([[ConnectionError("down")]]))
+
+    events = [json.loads(event[len("data: "):]) for event in routes.session_events("failed-session", "hello", Deadline())]
+
+    assert [event["type"] for event in events[-2:]] == ["error", "end"]
+    assert events[-1]["usage"]["model_calls"] == 1
+
+
+def test_resuming_unknown_session_is_rejected(app_client):
+    response = app_client.get(
+        "/api/v1/convert", params={"query": "10 km in miles", "session_id": "gone"}, headers={"Last-Event-ID": "12"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_admin_endpoints_require_admin_key(app_client, monkeypatch):
+    from app.api import routes
+
+    paths = ["/api/v1/clients", "/api/v1/usage/some-session", "/api/v1/debug/traces/some-session"]
+    assert [app_client.get(path).status_code for path in paths] == [403, 403, 403]
+
+    monkeypatch.setattr(routes, "ADMIN_API_KEY", "secret")
+    assert [app_client.get(path, headers={"X-Admin-Key": "wrong"}).status_code for path in paths] == [403, 403, 403]
+    assert [app_client.get(path, headers={"X-Admin-Key": "secret"}).status_code for path in paths] == [200, 404, 404]
@@ -10,6 +10,26 @@ import type {
 import { Bot } from "lucide-react";
 
 const API_URL = import.meta.env.VITE_API_URL;
+// Times a dropped stream is resumed from the last received event before giving up
+const MAX_RECONNECTS = 3;
+
+// Stable per-browser id sent as X-Client-ID, so each browser gets its own quota
+// instead of every UI user sharing the backend's "anonymous" client
+const CLIENT_ID_KEY = "clientId";
+const getClientId = (): string => {
+  let clientId = localStorage.getItem(CLIENT_ID_KEY);
+  if (!clientId) {
+    clientId = crypto.randomUUID();
+    localStorage.setItem(CLIENT_ID_KEY, clientId);
+  }
+  return clientId;
+};
+
+// Raised when the backend rejects a request because the client is over its quota
+class RateLimitError extends Error {}
+
+// Raised when a dropped session can no longer be resumed on the server
+class SessionGoneError extends Error {}
 
 const App = () => {
   const [messages, setMessages] = useState<Message[]>([
@@ -32,6 +52,8 @@ Try asking me:
   ]);
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // One conversation per page load, so follow-up questions keep their context on the server
+  const conversationId = useRef(crypto.randomUUID());
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -64,140 +86,236 @@ Try asking me:
 
     setMessages((prev) => [...prev, assistantMessage]);
 
+    // Resumption state: the server replays events after lastEventId for sessionId
+    let sessionId: string | undefined;
+    let lastEventId: string | undefined;
+    let finished = false;
+    let reconnects = 0;
+
     try {
-      const response = await fetch(
-        `${API_URL}/api/v1/convert?query=${encodeURIComponent(content)}`
-      );
+      while (!finished) {
+        try {
+          const sessionParam = sessionId
+            ? `&session_id=${encodeURIComponent(sessionId)}`
+            : "";
+          const response = await fetch(
+            `${API_URL}/api/v1/convert?query=${encodeURIComponent(content)}` +
+              `&conversation_id=${conversationId.current}${sessionParam}`,
+            {
+              headers: {
+                "X-Client-ID": getClientId(),
+                ...(lastEventId ? { "Last-Event-ID": lastEventId } : {}),
+              },
+            }
+          );
 
-      if (!response.ok) {
-        throw new Error("Failed to get response from server");
-      }
+          if (response.status === 429) {
+            const retryAfter = response.headers.get("Retry-After");
+            throw new RateLimitError(
+              `Too many requests. Please try again in ${retryAfter || "a few"} seconds.`
+            );
+          }
+          if (sessionId && (response.status === 404 || response.status === 410)) {
+            throw new SessionGoneError(
+              "The connection dropped and the response can no longer be resumed. Please ask again."
+            );
+          }
+          if (!response.ok) {
+            throw new Error("Failed to get response from server");
+          }
 
-      const reader = response.body?.getReader();
-      const decoder = new TextDecoder();
+          const reader = response.body?.getReader();
+          const decoder = new TextDecoder();
 
-      if (!reader) {
-        throw new Error("No response body");
-      }
+          if (!reader) {
+            throw new Error("No response body");
+          }
+
+          // Lines can be split across reads, so the unfinished last line is kept for the next one
+          let partialLine = "";
+          // An event's id only counts as received once its data line has been handled
+          let eventId: string | undefined;
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value);
-        const lines = chunk.split("\n");
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            try {
-              const data: StreamEvent = JSON.parse(line.slice(6));
-
-              setMessages((prev) =>
-                prev.map((msg) => {
-                  if (msg.id === assistantMessage.id) {
-                    if (data.type === "start") {
-                      return {
-                        ...msg,
-                        sessionId: data.session_id,
-                      };
-                    } else if (data.type === "step") {
-                      const newStep: ProcessingStep = {
-                        id: `step-${data.step_id}-${Date.now()}`,
-                        stepId: data.step_id || 0,
-                        stepName: data.step_name || "unknown",
-                        type: "step",
-                        description: data.description,
-                        status: data.status || "processing",
-                        toolName: data.tool_name,
-                        args: data.args,
-                        timestamp: new Date(),
-                      };
-
-                      return {
-                        ...msg,
-                        steps: [...(msg.steps || []), newStep],
-                      };
-                    } else if (data.type === "content") {
-                      const newStep: ProcessingStep = {
-                        id: `content-${data.step_id}-${Date.now()}`,
-                        stepId: data.step_id || 0,
-                        stepName: "content_generation",
-                        type: "content",
-                        content: data.content,
-                        status: "completed",
-                        timestamp: new Date(),
-                      };
-
-                      return {
-                        ...msg,
-                        content: msg.content + (data.content || ""),
-                        steps: [...(msg.steps || []), newStep],
-                      };
-                    } else if (data.type === "tool_execution") {
-                      const toolExecution: ToolExecution = {
-                        name: data.tool_name || "",
-                        args: data.args || {},
-                        result: data.result || "",
-                        stepId: data.step_id,
-                      };
-
-                      const newStep: ProcessingStep = {
-                        id: `tool-${data.step_id}-${Date.now()}`,
-                        stepId: data.step_id || 0,
-                        stepName: "tool_execution_result",
-                        type: "tool_execution",
-                        toolExecution,
-                        status: data.status || "completed",
-                        timestamp: new Date(),
-                      };
-
-                      return {
-                        ...msg,
-                        toolExecutions: [
-                          ...(msg.toolExecutions || []),
-                          toolExecution,
-                        ],
-                        steps: [...(msg.steps || []), newStep],
-                      };
-                    } else if (data.type === "error") {
-                      const errorStep: ProcessingStep = {
-                        id: `error-${data.step_id}-${Date.now()}`,
-                        stepId: data.step_id || 999,
-                        stepName: "error",
-                        type: "step",
-                        description: `Error: ${data.message}`,
-                        status: "error",
-                        timestamp: new Date(),
-                      };
-
-                      return {
-                        ...msg,
-                        content: `❌ Error: ${data.message}`,
-                        isError: true,
-                        steps: [...(msg.steps || []), errorStep],
-                      };
-                    } else if (data.type === "end") {
-                      // Handle session end - mark final step as completed
-                      const finalSteps =
-                        msg.steps?.map((step) =>
-                          step.status === "processing"
-                            ? { ...step, status: "completed" as const }
-                            : step
-                        ) || [];
-
-                      return {
-                        ...msg,
-                        steps: finalSteps,
-                      };
-                    }
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            const lines = (partialLine + decoder.decode(value, { stream: true })).split("\n");
+            partialLine = lines.pop() ?? "";
+
+            for (const line of lines) {
+              if (line.startsWith("id: ")) {
+                eventId = line.slice(4);
+              } else if (line.startsWith("data: ")) {
+                if (eventId) {
+                  lastEventId = eventId;
+                  eventId = undefined;
+                }
+                try {
+                  const data: StreamEvent = JSON.parse(line.slice(6));
+                  if (data.type === "start") {
+                    sessionId = data.session_id;
+                  } else if (data.type === "end") {
+                    finished = true;
                   }
-                  return msg;
-                })
-              );
-            } catch (e) {
-              console.error("Error parsing SSE data:", e);
+
+                  setMessages((prev) =>
+                    prev.map((msg) => {
+                      if (msg.id === assistantMessage.id) {
+                        if (data.type === "start") {
+                          return {
+                            ...msg,
+                            sessionId: data.session_id,
+                          };
+                        } else if (data.type === "step") {
+                          const newStep: ProcessingStep = {
+                            id: `step-${data.step_id}-${Date.now()}`,
+                            stepId: data.step_id || 0,
+                            stepName: data.step_name || "unknown",
+                            type: "step",
+                            description: data.description,
+                            status: data.status || "processing",
+                            toolName: data.tool_name,
+                            args: data.args,
+                            timestamp: new Date(),
+                          };
+
+                          return {
+                            ...msg,
+                            steps: [...(msg.steps || []), newStep],
+                          };
+                        } else if (data.type === "content") {
+                          const newStep: ProcessingStep = {
+                            id: `content-${data.step_id}-${Date.now()}`,
+                            stepId: data.step_id || 0,
+                            stepName: "content_generation",
+                            type: "content",
+                            content: data.content,
+                            status: "completed",
+                            timestamp: new Date(),
+                          };
+
+                          return {
+                            ...msg,
+                            content: msg.content + (data.content || ""),
+                            steps: [...(msg.steps || []), newStep],
+                          };
+                        } else if (data.type === "reset") {
+                          // Drop partial content streamed for this step before the retry
+                          const keptSteps = (msg.steps || []).filter(
+                            (step) =>
+                              !(step.type === "content" && step.stepId === data.step_id)
+                          );
+
+                          return {
+                            ...msg,
+                            content: keptSteps
+                              .filter((step) => step.type === "content")
+                              .map((step) => step.content || "")
+                              .join(""),
+                            steps: keptSteps,
+                          };
+                        } else if (data.type === "deadline_exceeded") {
+                          const deadlineStep: ProcessingStep = {
+                            id: `deadline-${data.step_id}-${Date.now()}`,
+                            stepId: data.step_id || 0,
+                            stepName: "deadline_exceeded",
+                            type: "step",
+                            description: data.message,
+                            status: "error",
+                            timestamp: new Date(),
+                          };
+
+                          return {
+                            ...msg,
+                            content:
+                              msg.content +
+                              (msg.content ? "\n\n" : "") +
+                              (data.partial_answer || ""),
+                            steps: [...(msg.steps || []), deadlineStep],
+                          };
+                        } else if (data.type === "tool_execution") {
+                          const toolExecution: ToolExecution = {
+                            name: data.tool_name || "",
+                            args: data.args || {},
+                            result: data.formatted_result || data.result || "",
+                            stepId: data.step_id,
+                          };
+
+                          const newStep: ProcessingStep = {
+                            id: `tool-${data.step_id}-${Date.now()}`,
+                            stepId: data.step_id || 0,
+                            stepName: "tool_execution_result",
+                            type: "tool_execution",
+                            toolExecution,
+                            status: data.status || "completed",
+                            timestamp: new Date(),
+                          };
+
+                          return {
+                            ...msg,
+                            toolExecutions: [
+                              ...(msg.toolExecutions || []),
+                              toolExecution,
+                            ],
+                            steps: [...(msg.steps || []), newStep],
+                          };
+                        } else if (data.type === "error") {
+                          const errorStep: ProcessingStep = {
+                            id: `error-${data.step_id}-${Date.now()}`,
+                            stepId: data.step_id || 999,
+                            stepName: "error",
+                            type: "step",
+                            description: `Error: ${data.message}`,
+                            status: "error",
+                            timestamp: new Date(),
+                          };
+
+                          return {
+                            ...msg,
+                            content: `❌ Error: ${data.message}`,
+                            isError: true,
+                            steps: [...(msg.steps || []), errorStep],
+                          };
+                        } else if (data.type === "end") {
+                          // Handle session end - mark final step as completed
+                          const finalSteps =
+                            msg.steps?.map((step) =>
+                              step.status === "processing"
+                                ? { ...step, status: "completed" as const }
+                                : step
+                            ) || [];
+
+                          return {
+                            ...msg,
+                            steps: finalSteps,
+                          };
+                        }
+                      }
+                      return msg;
+                    })
+                  );
+                } catch (e) {
+                  console.error("Error parsing SSE data:", e);
+                }
+              }
             }
           }
+          if (!finished) {
+            throw new Error("Stream ended before the response completed");
+          }
+        } catch (error) {
+          // Resume the same session instead of re-running the whole query
+          if (
+            finished ||
+            !sessionId ||
+            error instanceof SessionGoneError ||
+            reconnects >= MAX_RECONNECTS
+          ) {
+            throw error;
+          }
+          reconnects += 1;
+          await new Promise((resolve) => setTimeout(resolve, 1000 * reconnects));
         }
       }
     } catch (error) {
@@ -208,7 +326,9 @@ Try asking me:
             return {
               ...msg,
               content:
-                "❌ Sorry, I encountered an error while processing your request. Please make sure the backend server is running.",
+                error instanceof RateLimitError || error instanceof SessionGoneError
+                  ? `❌ ${error.message}`
+                  : "❌ Sorry, I encountered an error while processing your request. Please make sure the backend server is running.",
               isError: true,
             };
           }
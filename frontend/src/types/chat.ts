@@ -31,7 +31,16 @@ export interface ProcessingStep {
 }
 
 export interface StreamEvent {
-  type: "start" | "content" | "tool_execution" | "error" | "step" | "end";
+  type:
+    | "start"
+    | "content"
+    | "reset"
+    | "deadline_exceeded"
+    | "tool_execution"
+    | "error"
+    | "step"
+    | "stats"
+    | "end";
   content?: string;
   tool_name?: string;
   args?: Record<string, unknown>;
@@ -45,4 +54,7 @@ export interface StreamEvent {
   status?: "processing" | "completed" | "error";
   formatted_result?: string;
   timestamp?: string;
+  attempt?: number;
+  reason?: string;
+  partial_answer?: string;
 }